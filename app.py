@@ -1,26 +1,82 @@
+import time
+_import_start = time.perf_counter()
 import streamlit as st
 import os
 from security import SecurityManager
-from database import init_db, User, AuditLog, Document
-from rag_engine import RAGEngine
+from database import init_db, get_scoped_session, page_documents, page_audit_logs, page_query_logs, query_logs_for_audit, User, Document, IngestJob
+from audit import AuditWriter
+from tracing import tracer
+from warmup import Warmup, startup_report
 from sqlalchemy.orm import Session
 import datetime
-import tempfile
 import json
+# rag_engine and ingest_queue pull in langchain, Chroma and the model clients, so they
+# are imported by the warm-up thread instead of here
+startup_report.record("app imports", time.perf_counter() - _import_start)
+
+@st.cache_resource
+def get_warmup():
+    return Warmup(init_db(), SecurityManager()).start()
+
+def get_rag_engine():
+    # Shared by every session and the ingest worker so caches and indexes stay coherent
+    return get_warmup().engine()
+
+def get_ingest_worker():
+    return get_warmup().worker()
+
+@st.cache_resource
+def get_audit_writer():
+    return AuditWriter(init_db())
 
 # Initialize components
 if 'security_manager' not in st.session_state:
     st.session_state.security_manager = SecurityManager()
-if 'rag_engine' not in st.session_state:
-    st.session_state.rag_engine = RAGEngine()
-if 'db_session' not in st.session_state:
-    SessionLocal = init_db()
-    st.session_state.db_session = SessionLocal()
+# Thread-local session on the shared engine, removed at the end of each script run
+db_session = get_scoped_session()
+# Starts loading the RAG stack while the login page is shown
+get_warmup()
 
 def log_audit(action, details, user_id):
-    log = AuditLog(user_id=user_id, action=action, details=details)
-    st.session_state.db_session.add(log)
-    st.session_state.db_session.commit()
+    get_audit_writer().log(action, details, user_id)
+
+def stream_answer(prompt):
+    """Streams the assistant reply into the current container and audits it once complete."""
+    with tracer.span("chat", user=st.session_state.username):
+        with st.spinner("Searching documents..."):
+            source_documents, tokens = st.session_state.rag_engine.stream_query(prompt, owner=st.session_state.username)
+        answer = st.write_stream(tokens)
+    st.session_state.messages.append({"role": "assistant", "content": answer})
+
+    refs = {doc.metadata['source']: doc.metadata.get('document_id')
+            for doc in source_documents if 'source' in doc.metadata}
+    get_audit_writer().log_query(st.session_state.user_id, prompt, answer, refs.items())
+
+def render_query(username, prompt, response, refs):
+    st.markdown("**Conversation Details**")
+    st.divider()
+    st.markdown(f"**{username}:** {prompt or ''}")
+    st.markdown(f"**DocGPT:** {response or ''}")
+    st.divider()
+    ref_str = ", ".join([f"'{r}'" for r in refs]) if refs else "'None'"
+    st.markdown(f"**Refs:** {ref_str}")
+
+def current_cursor(key):
+    cursors = st.session_state.setdefault(f"{key}_cursors", [])
+    return cursors[-1] if cursors else None
+
+def render_pager(key, next_cursor):
+    """Newer/Older buttons for keyset pagination, keeping a stack of visited cursors."""
+    cursors = st.session_state.setdefault(f"{key}_cursors", [])
+    col_prev, col_next = st.columns(2)
+    with col_prev:
+        if cursors and st.button("← Newer", key=f"{key}_newer", use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with col_next:
+        if next_cursor is not None and st.button("Older →", key=f"{key}_older", use_container_width=True):
+            cursors.append(next_cursor)
+            st.rerun()
 
 def login_page():
     st.title("Secure Legal RAG - Login")
@@ -30,11 +86,12 @@ def login_page():
     col1, col2 = st.columns(2)
     with col1:
         if st.button("Login"):
-            user = st.session_state.db_session.query(User).filter_by(username=username).first()
+            user = db_session.query(User).filter_by(username=username).first()
             if user and st.session_state.security_manager.verify_password(user.password_hash, password):
                 st.session_state.user_id = user.id
                 st.session_state.username = user.username
                 st.session_state.role = user.role
+                get_warmup().warm_owner(user.username)
                 log_audit("LOGIN", "User logged in", user.id)
                 st.rerun()
             else:
@@ -42,13 +99,13 @@ def login_page():
     
     with col2:
         if st.button("Register"):
-            if st.session_state.db_session.query(User).filter_by(username=username).first():
+            if db_session.query(User).filter_by(username=username).first():
                 st.error("Username exists")
             else:
                 hashed = st.session_state.security_manager.hash_password(password)
                 new_user = User(username=username, password_hash=hashed)
-                st.session_state.db_session.add(new_user)
-                st.session_state.db_session.commit()
+                db_session.add(new_user)
+                db_session.commit()
                 st.success("Registered! Please login.")
                 log_audit("REGISTER", f"New user registered: {username}", new_user.id)
 
@@ -178,6 +235,9 @@ def inject_custom_css():
 
 def main_app():
     inject_custom_css()
+    if 'rag_engine' not in st.session_state:
+        with st.spinner("Loading the document engine..."):
+            st.session_state.rag_engine = get_rag_engine()
     # Initialize page state
     if "current_page" not in st.session_state:
         st.session_state.current_page = "Chat Assistant"
@@ -198,6 +258,10 @@ def main_app():
         if st.button("📜 Audit Logs", use_container_width=True):
             st.session_state.current_page = "Audit Logs"
             st.rerun()
+
+        if st.session_state.role == 'admin' and st.button("⏱️ Performance", use_container_width=True):
+            st.session_state.current_page = "Performance"
+            st.rerun()
         
         # Upload Popover in Sidebar
         with st.popover("➕ Add Document", use_container_width=True):
@@ -205,41 +269,46 @@ def main_app():
             uploaded_file = st.file_uploader("Select PDF", type="pdf", label_visibility="collapsed")
             if uploaded_file:
                 if st.button("Process Upload", use_container_width=True):
-                    with st.spinner("Processing..."):
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                            tmp.write(uploaded_file.getvalue())
-                            tmp_path = tmp.name
+                    with st.spinner("Processing..."), tracer.span("upload", size=uploaded_file.size):
+                        data = uploaded_file.getvalue()
                         
-                        storage_dir = "storage"
-                        os.makedirs(storage_dir, exist_ok=True)
-                        encrypted_path = os.path.join(storage_dir, f"{uploaded_file.name}.enc")
-                        
-                        st.session_state.security_manager.encrypt_file(tmp_path)
-                        import shutil
-                        shutil.move(tmp_path, encrypted_path)
-                        
-                        # Auto-generate description
-                        desc = f"Uploaded on {datetime.datetime.now().strftime('%Y-%m-%d')}"
-                        
-                        new_doc = Document(filename=uploaded_file.name, owner_id=st.session_state.user_id, encrypted_path=encrypted_path, description=desc)
-                        st.session_state.db_session.add(new_doc)
-                        st.session_state.db_session.commit()
-                        
-                        decrypted_content = st.session_state.security_manager.decrypt_file(encrypted_path)
-                        from langchain_community.document_loaders import PyPDFLoader
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_decrypt:
-                            tmp_decrypt.write(decrypted_content)
-                            decrypt_path = tmp_decrypt.name
-                        
-                        loader = PyPDFLoader(decrypt_path)
-                        pages = loader.load()
-                        full_text = "".join([p.page_content for p in pages])
-                        
-                        st.session_state.rag_engine.ingest_document(full_text, {"source": uploaded_file.name, "owner": st.session_state.username})
-                        os.remove(decrypt_path)
-                        
-                        log_audit("UPLOAD", f"Uploaded {uploaded_file.name}", st.session_state.user_id)
-                        st.success("Uploaded!")
+                        # Skip all work if this exact file was already uploaded by this user
+                        with tracer.span("upload.hash"):
+                            file_hash = st.session_state.security_manager.get_data_hash(data)
+                        existing = db_session.query(Document)\
+                            .filter_by(owner_id=st.session_state.user_id, file_hash=file_hash).first()
+                        if existing:
+                            st.info(f"Already uploaded as {existing.filename}")
+                        else:
+                            storage_dir = "storage"
+                            os.makedirs(storage_dir, exist_ok=True)
+                            encrypted_path = os.path.join(storage_dir, f"{uploaded_file.name}.enc")
+                            st.session_state.security_manager.encrypt_to_file([data], encrypted_path)
+                            
+                            # Auto-generate description
+                            desc = f"Uploaded on {datetime.datetime.now().strftime('%Y-%m-%d')}"
+                            
+                            with tracer.span("upload.db"):
+                                new_doc = Document(filename=uploaded_file.name, owner_id=st.session_state.user_id, encrypted_path=encrypted_path, description=desc, file_hash=file_hash)
+                                db_session.add(new_doc)
+                                db_session.flush()
+                                from ingest_queue import enqueue_ingest
+                                job = enqueue_ingest(db_session, new_doc, st.session_state.username)
+                                db_session.flush()
+                                # Indexing happens in the background; hand over the bytes so the worker skips
+                                # decryption. This must happen before the commit makes the job claimable.
+                                worker = get_ingest_worker()
+                                worker.stage(job.id, data)
+                                try:
+                                    db_session.commit()
+                                except Exception:
+                                    worker.discard(job.id)
+                                    raise
+                            worker.submit(job.id)
+                            
+                            log_audit("UPLOAD", f"Uploaded {uploaded_file.name}", st.session_state.user_id)
+                            st.success("Uploaded! Indexing in the background.")
+                    if not existing:
                         st.rerun()
         
         st.divider()
@@ -269,15 +338,11 @@ def main_app():
             # Handle Submission from Landing Page
             if initial_prompt:
                 st.session_state.messages.append({"role": "user", "content": initial_prompt})
-                # Process the query immediately
-                with st.spinner("Thinking..."):
-                    response = st.session_state.rag_engine.query(initial_prompt)
-                    answer = response['result']
-                    st.session_state.messages.append({"role": "assistant", "content": answer})
-                    
-                    # Log
-                    log_details = json.dumps({"prompt": initial_prompt, "response": answer, "refs": []})
-                    log_audit("QUERY", log_details, st.session_state.user_id)
+                # Process the query immediately, streaming tokens as they arrive
+                with st.chat_message("user"):
+                    st.markdown(initial_prompt)
+                with st.chat_message("assistant"):
+                    stream_answer(initial_prompt)
                 st.rerun()
 
         # STANDARD CHAT STATE (Messages Exist)
@@ -293,29 +358,8 @@ def main_app():
                     st.markdown(prompt)
 
                 with st.chat_message("assistant"):
-                    with st.spinner("Thinking..."):
-                        response = st.session_state.rag_engine.query(prompt)
-                        answer = response['result']
-                        
-                        # Extract references
-                        sources = set()
-                        if 'source_documents' in response:
-                            for doc in response['source_documents']:
-                                if 'source' in doc.metadata:
-                                    sources.add(doc.metadata['source'])
-                        
-                        st.markdown(answer)
-                        # Sources hidden as per user request
-                        
-                        st.session_state.messages.append({"role": "assistant", "content": answer})
-                        
-                        # Structured Log
-                        log_details = json.dumps({
-                            "prompt": prompt,
-                            "response": answer,
-                            "refs": list(sources) if sources else []
-                        })
-                        log_audit("QUERY", log_details, st.session_state.user_id)
+                    # Sources hidden as per user request
+                    stream_answer(prompt)
 
     elif st.session_state.current_page == "Documents":
         st.header("Document Explorer")
@@ -323,15 +367,26 @@ def main_app():
         # Search Bar
         search_query = st.text_input("🔍 Search Documents", placeholder="Search by filename...")
         
-        query = st.session_state.db_session.query(Document).filter_by(owner_id=st.session_state.user_id)
-        if search_query:
-            query = query.filter(Document.filename.contains(search_query))
+        if st.session_state.get("doc_search") != search_query:
+            st.session_state.doc_search = search_query
+            st.session_state.docs_cursors = []
         
-        docs = query.all()
+        docs, next_cursor = page_documents(db_session, st.session_state.user_id, search=search_query,
+                                           after_id=current_cursor("docs"))
         
         if not docs:
             st.info("No documents found.")
         else:
+            # Latest ingestion job per document, for status display
+            jobs = {}
+            for job in db_session.query(IngestJob)\
+                    .filter(IngestJob.document_id.in_([d.id for d in docs]))\
+                    .order_by(IngestJob.id):
+                jobs[job.document_id] = job
+            
+            if any(job.status in ('queued', 'running') for job in jobs.values()):
+                st.button("🔄 Refresh indexing status")
+            
             # Grid Layout for Drive Style
             cols = st.columns(3)
             for idx, doc in enumerate(docs):
@@ -340,6 +395,11 @@ def main_app():
                         st.markdown(f"#### 📄 {doc.filename}")
                         st.caption(f"📅 {doc.upload_date.strftime('%Y-%m-%d')}")
                         st.caption(f"📝 {doc.description}")
+                        job = jobs.get(doc.id)
+                        if job and job.status == 'failed':
+                            st.error(f"Indexing failed: {job.error}")
+                        elif job and job.status != 'done':
+                            st.progress(job.progress or 0.0, text=f"Indexing ({job.status})")
                         
                         col_d1, col_d2 = st.columns(2)
                         with col_d1:
@@ -362,47 +422,144 @@ def main_app():
                         
                         with col_d2:
                             if st.button("🗑️", key=f"del_{doc.id}", help="Delete Document", type="primary", use_container_width=True):
-                                st.session_state.db_session.delete(doc)
-                                st.session_state.db_session.commit()
-                                # Optional: Remove from disk and vector store (complex for vector store, simple for disk)
+                                job_ids = [job_id for (job_id,) in db_session.query(IngestJob.id).filter_by(document_id=doc.id)]
+                                db_session.query(IngestJob).filter_by(document_id=doc.id).delete()
+                                db_session.delete(doc)
+                                db_session.commit()
+                                # Jobs deleted before a worker claimed them would otherwise keep their upload in memory
+                                for job_id in job_ids:
+                                    get_ingest_worker().discard(job_id)
                                 if os.path.exists(doc.encrypted_path):
                                     os.remove(doc.encrypted_path)
+                                st.session_state.rag_engine.delete_document(
+                                    doc.id, owner=st.session_state.username, source=doc.filename)
                                 log_audit("DELETE", f"Deleted {doc.filename}", st.session_state.user_id)
                                 st.rerun()
+        
+        render_pager("docs", next_cursor)
 
     elif st.session_state.current_page == "Audit Logs":
         st.header("Audit Logs")
         
         if st.session_state.role == 'admin' or True:
-            # Join AuditLog with User to get username
-            logs = st.session_state.db_session.query(AuditLog, User.username)\
-                .join(User, AuditLog.user_id == User.id)\
-                .order_by(AuditLog.timestamp.desc())\
-                .limit(50).all()
+            events_tab, queries_tab = st.tabs(["All events", "Queries"])
             
-            for log, username in logs:
-                timestamp_str = log.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+            with events_tab:
+                # Join AuditLog with User to get username
+                logs, next_cursor = page_audit_logs(db_session, before=current_cursor("audit"))
+                query_logs = query_logs_for_audit(db_session, [log.id for log, _ in logs if log.action == "QUERY"])
                 
-                if log.action == "QUERY":
-                    with st.popover(f"{timestamp_str} - {username} - QUERY", use_container_width=True):
-                        try:
-                            details = json.loads(log.details)
-                            st.markdown("**Conversation Details**")
-                            st.divider()
-                            st.markdown(f"**{username}:** {details.get('prompt', '')}")
-                            st.markdown(f"**DocGPT:** {details.get('response', '')}")
-                            st.divider()
-                            
-                            refs = details.get('refs', [])
-                            ref_str = ", ".join([f"'{r}'" for r in refs]) if refs else "'None'"
-                            st.markdown(f"**Refs:** {ref_str}")
-                        except json.JSONDecodeError:
-                            st.text(f"Details: {log.details}")
-                else:
-                    st.text(f"{timestamp_str} - {username} - {log.action}: {log.details}")
+                for log, username in logs:
+                    timestamp_str = log.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+                    
+                    if log.action == "QUERY":
+                        with st.popover(f"{timestamp_str} - {username} - QUERY", use_container_width=True):
+                            if log.id in query_logs:
+                                query_log, refs = query_logs[log.id]
+                                render_query(username, query_log.prompt, query_log.response, refs)
+                            else:
+                                # Entries written before query logs existed and not yet backfilled
+                                try:
+                                    details = json.loads(log.details)
+                                    render_query(username, details.get('prompt', ''), details.get('response', ''),
+                                                 details.get('refs', []))
+                                except (TypeError, json.JSONDecodeError):
+                                    st.text(f"Details: {log.details}")
+                    else:
+                        st.text(f"{timestamp_str} - {username} - {log.action}: {log.details}")
+                
+                render_pager("audit", next_cursor)
+            
+            with queries_tab:
+                col_user, col_doc, col_dates = st.columns(3)
+                with col_user:
+                    user_filter = st.text_input("User", key="query_user_filter")
+                with col_doc:
+                    source_filter = st.text_input("Referenced document", key="query_source_filter")
+                with col_dates:
+                    dates = st.date_input("Date range", value=(), key="query_date_filter")
+                
+                filters = {}
+                if user_filter:
+                    user = db_session.query(User).filter_by(username=user_filter).first()
+                    filters["user_id"] = user.id if user else -1
+                if source_filter:
+                    filters["source"] = source_filter
+                if len(dates) >= 1:
+                    filters["start"] = datetime.datetime.combine(dates[0], datetime.time.min)
+                if len(dates) == 2:
+                    filters["end"] = datetime.datetime.combine(dates[1], datetime.time.min) + datetime.timedelta(days=1)
+                
+                # A new filter starts again from the newest page
+                if st.session_state.get("query_filters") != filters:
+                    st.session_state.query_filters = filters
+                    st.session_state["queries_cursors"] = []
+                
+                rows, next_cursor = page_query_logs(db_session, before=current_cursor("queries"), **filters)
+                if not rows:
+                    st.info("No queries match these filters.")
+                for query_log, username, refs in rows:
+                    timestamp_str = query_log.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+                    with st.popover(f"{timestamp_str} - {username} - {query_log.prompt or ''}"[:120], use_container_width=True):
+                        render_query(username, query_log.prompt, query_log.response, refs)
+                
+                render_pager("queries", next_cursor)
+
+    elif st.session_state.current_page == "Performance" and st.session_state.role == 'admin':
+        st.header("Performance")
+        
+        summary = tracer.summary()
+        if not summary:
+            st.info("No traced requests yet.")
+        else:
+            st.subheader("Latency by stage")
+            st.dataframe(
+                [{"Stage": row["stage"], "Count": row["count"],
+                  "p50 (ms)": round(row["p50_s"] * 1000, 1), "p95 (ms)": round(row["p95_s"] * 1000, 1),
+                  "p99 (ms)": round(row["p99_s"] * 1000, 1), "Max (ms)": round(row["max_s"] * 1000, 1)}
+                 for row in summary],
+                use_container_width=True, hide_index=True
+            )
+            
+            stage = st.selectbox("Latency histogram", [row["stage"] for row in summary])
+            histogram = tracer.histogram(stage)
+            st.dataframe(
+                [{"Latency": bucket, "Requests": count} for bucket, count in histogram.items()],
+                column_config={"Requests": st.column_config.ProgressColumn(
+                    "Requests", format="%d", min_value=0, max_value=max(histogram.values()) or 1)},
+                use_container_width=True, hide_index=True
+            )
+            
+            st.subheader("Slowest recent requests")
+            for entry in tracer.slowest(10):
+                root = entry["root"]
+                started = datetime.datetime.fromtimestamp(root["start"]).strftime('%Y-%m-%d %H:%M:%S')
+                with st.expander(f"{started} - {root['name']} - {root['duration'] * 1000:.0f} ms"):
+                    if root["attrs"]:
+                        st.caption(", ".join(f"{k}={v}" for k, v in root["attrs"].items()))
+                    st.dataframe(
+                        [{"Stage": name, "Time (ms)": round(seconds * 1000, 1)}
+                         for name, seconds in sorted(entry["stages"].items(), key=lambda item: -item[1])],
+                        use_container_width=True, hide_index=True
+                    )
+        
+        with st.expander("Startup time"):
+            st.dataframe(
+                [{"Step": row["step"], "Seconds": round(row["seconds"], 3)} for row in startup_report.rows()],
+                use_container_width=True, hide_index=True
+            )
+        with st.expander("Engine queues and caches"):
+            st.json({"scheduler": st.session_state.rag_engine.scheduler_stats(),
+                     "caches": st.session_state.rag_engine.cache_stats(),
+                     "context_packing": st.session_state.rag_engine.context_packer.stats()})
+        with st.expander("Prometheus export"):
+            st.code(tracer.prometheus_text(), language="text")
 
 if __name__ == "__main__":
-    if 'user_id' not in st.session_state:
-        login_page()
-    else:
-        main_app()
+    try:
+        if 'user_id' not in st.session_state:
+            login_page()
+        else:
+            main_app()
+    finally:
+        db_session.remove()
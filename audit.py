@@ -0,0 +1,161 @@
+import atexit
+import datetime
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+
+from database import AuditLog, QueryLog, QueryRef
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    """Queues audit records and writes them in batched transactions on a background thread.
+
+    Callers never wait on SQLite's write lock; one commit covers up to ``batch_size``
+    records. A batch that fails with a transient error (locked or unavailable database)
+    is kept and retried with exponential backoff capped at ``max_retry_delay``; it is only
+    dropped after ``close()``, once ``max_retries`` attempts have failed. A batch rejected
+    by the database is retried record by record so one bad record cannot block the
+    rest. The queue is drained on ``close()``, which also runs at interpreter exit.
+    """
+
+    def __init__(self, session_factory, batch_size=200, flush_interval=0.25,
+                 retry_delay=0.1, max_retry_delay=5.0, max_retries=5):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_retries = max_retries
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, action, details, user_id):
+        if self._closed:
+            raise RuntimeError("AuditWriter is closed")
+        self._queue.put({
+            "user_id": user_id,
+            "action": action,
+            "details": details,
+            "timestamp": datetime.datetime.utcnow(),
+        })
+
+    def log_query(self, user_id, prompt, response, refs):
+        """Queues a QUERY audit event with its structured query log. refs are (source, document_id) pairs."""
+        if self._closed:
+            raise RuntimeError("AuditWriter is closed")
+        self._queue.put({
+            "user_id": user_id,
+            "action": "QUERY",
+            "details": None,
+            "timestamp": datetime.datetime.utcnow(),
+            "query": {"prompt": prompt, "response": response, "refs": dict(refs)},
+        })
+
+    def flush(self):
+        """Blocks until every record queued so far has been committed."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        batch = []
+        waiters = []
+        failures = 0
+        stop = False
+        while True:
+            if not stop and len(batch) < self.batch_size:
+                stop = self._collect(batch, waiters, block=not batch)
+            if batch:
+                try:
+                    self._write(batch)
+                    batch = []
+                    failures = 0
+                except OperationalError:
+                    failures += 1
+                    logger.warning("Audit batch of %d records failed to commit, will retry", len(batch), exc_info=True)
+                    if stop and failures >= self.max_retries:
+                        logger.error("Dropping %d audit records after %d failed writes", len(batch), failures)
+                        batch = []
+                    else:
+                        time.sleep(min(self.retry_delay * 2 ** (failures - 1), self.max_retry_delay))
+                except Exception:
+                    batch = self._write_each(batch)
+            if not batch:
+                for waiter in waiters:
+                    waiter.set()
+                waiters = []
+                if stop:
+                    return
+
+    def _collect(self, batch, waiters, block):
+        """Moves queued records into batch until it is full or the queue goes quiet. Returns True on close()."""
+        timeout = None if block else 0
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                return False
+            if item is None:
+                return True
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            else:
+                batch.append(item)
+            timeout = self.flush_interval if batch else 0
+        return False
+
+    def _write_each(self, batch):
+        """Writes records one at a time, dropping the ones the database rejects. Returns those still to retry."""
+        remaining = []
+        for record in batch:
+            try:
+                self._write([record])
+            except OperationalError:
+                remaining.append(record)
+            except Exception:
+                logger.exception("Dropping audit record %s for user %s", record["action"], record["user_id"])
+        return remaining
+
+    def _write(self, batch):
+        session = self.session_factory()
+        try:
+            events = [record for record in batch if "query" not in record]
+            if events:
+                session.execute(insert(AuditLog), events)
+            queries = [record for record in batch if "query" in record]
+            if queries:
+                # Query events need their audit IDs, so they go through the ORM's batched flush
+                audits = [AuditLog(**{k: v for k, v in record.items() if k != "query"}) for record in queries]
+                session.add_all(audits)
+                session.flush()
+                logs = [QueryLog(audit_log_id=audit.id, user_id=audit.user_id, timestamp=audit.timestamp,
+                                 prompt=record["query"]["prompt"], response=record["query"]["response"])
+                        for audit, record in zip(audits, queries)]
+                session.add_all(logs)
+                session.flush()
+                refs = [{"query_log_id": log.id, "source": source, "document_id": document_id}
+                        for log, record in zip(logs, queries) for source, document_id in record["query"]["refs"].items()]
+                if refs:
+                    session.execute(insert(QueryRef), refs)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
@@ -0,0 +1,118 @@
+"""Audit logging overhead per request: synchronous commit vs. the group-committing AuditWriter.
+
+The synchronous baseline is run twice: on a plain engine with SQLite's default pragmas
+(rollback journal, synchronous=FULL), as the app ran before, and on init_db()'s WAL engine,
+so the writer's gain is not mixed up with the gain from the pragmas.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_audit --threads 8 --records 500
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from audit import AuditWriter
+from database import init_db, AuditLog, Base
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples):
+    return {
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+def run_threads(threads, records, log_once):
+    samples = []
+    lock = threading.Lock()
+
+    def worker():
+        local = []
+        for i in range(records):
+            start = time.perf_counter()
+            log_once(i)
+            local.append(time.perf_counter() - start)
+        with lock:
+            samples.extend(local)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return samples, time.perf_counter() - started
+
+
+def default_pragmas_db(url):
+    """Session factory on an engine without init_db()'s WAL, synchronous and busy_timeout pragmas."""
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def bench_sync(session_factory, threads, records):
+    local = threading.local()
+
+    def log_once(i):
+        if not hasattr(local, "session"):
+            local.session = session_factory()
+        local.session.add(AuditLog(user_id=1, action="QUERY", details=f"sync {i}"))
+        local.session.commit()
+
+    return run_threads(threads, records, log_once)
+
+
+def bench_writer(session_factory, threads, records):
+    writer = AuditWriter(session_factory)
+
+    def log_once(i):
+        writer.log("QUERY", f"async {i}", 1)
+
+    samples, elapsed = run_threads(threads, records, log_once)
+    drain_start = time.perf_counter()
+    writer.close()
+    return samples, elapsed + (time.perf_counter() - drain_start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--records", type=int, default=500, help="Records per thread")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        configurations = (
+            ("sync_commit_default_pragmas", default_pragmas_db, bench_sync),
+            ("sync_commit_wal", init_db, bench_sync),
+            ("audit_writer_wal", init_db, bench_writer),
+        )
+        for name, make_db, bench in configurations:
+            session_factory = make_db(f"sqlite:///{os.path.join(tmp, name + '.db')}")
+            samples, elapsed = bench(session_factory, args.threads, args.records)
+            session = session_factory()
+            written = session.query(AuditLog).count()
+            session.close()
+            results[name] = dict(summarize(samples), total_s=elapsed, records_written=written)
+
+    print(json.dumps({"threads": args.threads, "records_per_thread": args.records, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Embedding backends compared on ingest throughput, vector size and retrieval recall.
+
+Each backend is given as ``backend:model``. Queries are sentences taken from the
+corpus with a third of their words dropped; a hit is any top-k chunk containing
+the original sentence. Ollama backends can run against the local stand-in:
+
+    python -m benchmarks.bench_embeddings --fake-ollama \\
+        --backend sentence-transformers:sentence-transformers/all-MiniLM-L6-v2 --backend ollama:llama3
+"""
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import corpus
+from benchmarks.fake_ollama import FakeOllamaConfig, start_server
+from embedding_backends import create_embeddings
+from streaming_splitter import StreamingSplitter, iter_pdf_pages, open_pdf
+
+SENTENCE = re.compile(r"[^.]{40,}?\.(?=\s|$)")
+
+
+def corpus_chunks(paths):
+    splitter = StreamingSplitter(chunk_size=1000, chunk_overlap=200)
+    chunks = []
+    for path in paths:
+        with open(path, "rb") as f:
+            pages = iter_pdf_pages(open_pdf(f))
+            chunks.extend(c.page_content for c in splitter.split_pages(pages, {}))
+    return chunks
+
+
+def make_queries(chunks, count, seed):
+    """Returns (query, relevant chunk indices) pairs."""
+    rng = random.Random(seed)
+    queries = []
+    while len(queries) < count:
+        sentences = [s.strip() for s in SENTENCE.findall(rng.choice(chunks))]
+        if not sentences:
+            continue
+        sentence = rng.choice(sentences)
+        words = sentence.split()
+        kept = [w for w in words if rng.random() > 0.33] or words
+        relevant = {i for i, chunk in enumerate(chunks) if sentence in chunk}
+        queries.append((" ".join(kept), relevant))
+    return queries
+
+
+def normalized(vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def bench_backend(spec, chunks, queries, k, batch_size, base_url):
+    backend, model = spec.split(":", 1)
+    start = time.perf_counter()
+    embeddings = create_embeddings(backend, model, base_url)
+    load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectors = []
+    for i in range(0, len(chunks), batch_size):
+        vectors.extend(embeddings.embed_documents(chunks[i:i + batch_size]))
+    embed_s = time.perf_counter() - start
+    matrix = normalized(vectors)
+
+    start = time.perf_counter()
+    query_matrix = normalized([embeddings.embed_query(q) for q, _ in queries])
+    query_s = time.perf_counter() - start
+
+    top = np.argsort(-(query_matrix @ matrix.T), axis=1)[:, :k]
+    hits = sum(1 for row, (_, relevant) in zip(top, queries) if relevant.intersection(row.tolist()))
+    return {
+        "backend": backend,
+        "model": model,
+        "dimension": int(matrix.shape[1]),
+        "index_bytes_float32": int(matrix.nbytes),
+        "load_s": load_s,
+        "chunks_per_sec": len(chunks) / embed_s if embed_s else 0.0,
+        "query_ms": query_s / len(queries) * 1000 if queries else 0.0,
+        f"recall_at_{k}": hits / len(queries) if queries else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", action="append", required=True, help="backend:model, repeatable")
+    parser.add_argument("--size", choices=sorted(corpus.SIZES), default="small")
+    parser.add_argument("--corpus-dir", help="Reuse generated PDFs from this directory")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--fake-ollama", action="store_true", help="Serve Ollama backends from the local stand-in")
+    args = parser.parse_args(argv)
+
+    server = None
+    base_url = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+    if args.fake_ollama:
+        server, base_url = start_server(FakeOllamaConfig(embed_latency=0.0))
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = corpus.generate(args.corpus_dir or os.path.join(workdir, "corpus"), args.size, args.seed)
+        chunks = corpus_chunks(paths)
+        queries = make_queries(chunks, args.queries, args.seed)
+        for spec in args.backend:
+            results.append(bench_backend(spec, chunks, queries, args.k, args.batch_size, base_url))
+    if server is not None:
+        server.shutdown()
+    print(json.dumps({"size": args.size, "chunks": len(chunks), "queries": len(queries), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
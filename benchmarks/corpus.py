@@ -0,0 +1,145 @@
+"""Synthetic legal-contract PDFs for benchmarks, generated deterministically from a seed.
+
+    python -m benchmarks.corpus --size small --output /tmp/corpus
+"""
+import argparse
+import os
+import random
+
+SIZES = {
+    "small": {"documents": 10, "pages": 5},
+    "medium": {"documents": 100, "pages": 10},
+    "large": {"documents": 1000, "pages": 20},
+}
+
+PARTIES = ["Acme Holdings Ltd", "Northwind Traders LLC", "Globex Corporation", "Initech Partners LLP",
+           "Umbrella Logistics plc", "Stark Industrial Inc", "Wayne Capital LP", "Hooli Services GmbH"]
+TOPICS = ["Termination", "Confidentiality", "Indemnification", "Limitation of Liability", "Governing Law",
+          "Payment Terms", "Intellectual Property", "Force Majeure", "Assignment", "Dispute Resolution",
+          "Warranties", "Non-Solicitation", "Data Protection", "Insurance", "Notices"]
+SENTENCES = [
+    "Either party may terminate this Agreement upon {days} days' written notice to the other party.",
+    "The Receiving Party shall not disclose Confidential Information to any third party without prior written consent.",
+    "The Supplier shall indemnify the Customer against all losses arising from a breach of clause {clause}.",
+    "In no event shall either party's aggregate liability exceed {amount} in any contract year.",
+    "This Agreement shall be governed by and construed in accordance with the laws of {law}.",
+    "Invoices are payable within {days} days of receipt, failing which interest accrues at {rate} per cent per annum.",
+    "All Intellectual Property Rights in the Deliverables shall vest in {party} upon payment in full.",
+    "Neither party shall be liable for delay caused by events beyond its reasonable control as defined in section {clause}.",
+    "Neither party may assign its rights under this Agreement without the consent of {party}.",
+    "Any dispute shall first be referred to senior executives and thereafter to arbitration under clause {clause}.",
+    "The Supplier warrants that the Services will be performed with reasonable skill and care.",
+    "For {months} months after termination neither party shall solicit the employees of the other.",
+    "Each party shall comply with the Data Protection Legislation, including Article {article} of the GDPR.",
+    "The Supplier shall maintain professional indemnity insurance of not less than {amount}.",
+    "Notices shall be delivered by hand or recorded delivery to the address stated in Schedule {schedule}.",
+]
+LAWS = ["England and Wales", "the State of New York", "Delaware", "Singapore", "Ireland"]
+
+
+def contract_pages(rng, doc_index, pages):
+    """Returns a list of pages, each a list of text lines."""
+    party_a, party_b = rng.sample(PARTIES, 2)
+    result = []
+    section = 1
+    for page in range(pages):
+        lines = []
+        if page == 0:
+            lines.append(f"MASTER SERVICES AGREEMENT No. {doc_index:05d}")
+            lines.append(f"between {party_a} and {party_b}")
+        while len(lines) < 40:
+            topic = rng.choice(TOPICS)
+            lines.append(f"{section}. {topic.upper()}")
+            for sub in range(1, rng.randint(2, 4)):
+                sentence = rng.choice(SENTENCES).format(
+                    days=rng.choice([7, 14, 30, 60, 90]),
+                    clause=f"{rng.randint(1, 30)}.{rng.randint(1, 9)}",
+                    amount=f"GBP {rng.randint(1, 50) * 100000:,}",
+                    law=rng.choice(LAWS),
+                    rate=rng.choice([2, 4, 8]),
+                    party=rng.choice([party_a, party_b]),
+                    months=rng.choice([6, 12, 24]),
+                    article=rng.choice([28, 32, 33]),
+                    schedule=rng.randint(1, 6),
+                )
+                lines.extend(wrap(f"{section}.{sub} {sentence}", 90))
+            section += 1
+        result.append(lines)
+    return result
+
+
+def wrap(text, width):
+    words = text.split()
+    lines, current = [], ""
+    for word in words:
+        if current and len(current) + 1 + len(word) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """Writes a minimal text-only PDF with one Helvetica text block per page."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        stream = "BT /F1 10 Tf 50 800 Td 12 TL\n" + "\n".join(f"({_escape(line)}) '" for line in lines) + "\nET"
+        data = stream.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode("ascii")
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def generate(output_dir, size="small", seed=1234):
+    """Generates the corpus for a size preset and returns the list of PDF paths."""
+    spec = SIZES[size]
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for i in range(spec["documents"]):
+        path = os.path.join(output_dir, f"contract_{i:05d}.pdf")
+        if not os.path.exists(path):
+            write_pdf(path, contract_pages(rng, i, spec["pages"]))
+        else:
+            contract_pages(rng, i, spec["pages"])  # keep the random stream aligned
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", choices=sorted(SIZES), default="small")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args(argv)
+    paths = generate(args.output, args.size, args.seed)
+    print(f"Wrote {len(paths)} PDFs to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
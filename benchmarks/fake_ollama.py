@@ -0,0 +1,136 @@
+"""Local stand-in for the Ollama HTTP API with deterministic output and configurable latency.
+
+Embeddings are hashed bags of words, so texts sharing terms get similar vectors and
+retrieval quality stays meaningful. Generation streams a fixed number of tokens.
+
+    python -m benchmarks.fake_ollama --port 11500 --token-latency 0.02
+"""
+import argparse
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORD = re.compile(r"\w+")
+
+
+def embed_text(text, dim):
+    vector = [0.0] * dim
+    for word in WORD.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class FakeOllamaConfig:
+    def __init__(self, dim=384, embed_latency=0.005, first_token_latency=0.2, token_latency=0.01, tokens=64):
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = FakeOllamaConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "llama3:latest"}]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        payload = self._read_json()
+        if self.path == "/api/embeddings":
+            time.sleep(self.config.embed_latency)
+            self._send_json({"embedding": embed_text(payload.get("prompt", ""), self.config.dim)})
+        elif self.path == "/api/embed":
+            inputs = payload.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            time.sleep(self.config.embed_latency * max(1, len(inputs)))
+            self._send_json({"embeddings": [embed_text(text, self.config.dim) for text in inputs]})
+        elif self.path == "/api/generate":
+            self._generate(payload)
+        else:
+            self.send_error(404)
+
+    def _generate(self, payload):
+        seed = hashlib.sha256(payload.get("prompt", "").encode("utf-8")).hexdigest()
+        words = [f"w{seed[i % 60:i % 60 + 4]}" for i in range(self.config.tokens)]
+        if payload.get("stream", True) is False:
+            time.sleep(self.config.first_token_latency + self.config.token_latency * len(words))
+            self._send_json({"model": payload.get("model"), "response": " ".join(words), "done": True})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(self.config.first_token_latency)
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(self.config.token_latency)
+            self._write_chunk({"model": payload.get("model"), "response": word + " ", "done": False})
+        self._write_chunk({"model": payload.get("model"), "response": "", "done": True})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, payload):
+        line = json.dumps(payload).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """Starts the stand-in on a background thread and returns (server, base_url)."""
+    handler = type("ConfiguredHandler", (FakeOllamaHandler,), {"config": config or FakeOllamaConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--embed-latency", type=float, default=0.005)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--tokens", type=int, default=64)
+    args = parser.parse_args(argv)
+    config = FakeOllamaConfig(args.dim, args.embed_latency, args.first_token_latency, args.token_latency, args.tokens)
+    server, url = start_server(config, args.host, args.port)
+    print(f"Fake Ollama listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
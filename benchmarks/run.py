@@ -0,0 +1,223 @@
+"""Offline benchmark suite: ingest, query, encryption and SQLite paths against a local Ollama stand-in.
+
+Results are written as JSON so runs can be compared across commits:
+
+    python -m benchmarks.run --size small --output bench-results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import corpus
+from benchmarks.fake_ollama import FakeOllamaConfig, start_server
+
+OWNER = "bench"
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000
+
+    return {"count": len(ordered), "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99), "max_ms": ordered[-1] * 1000}
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_ingest(engine, paths):
+    from bulk_ingest import extract_pdf_text
+
+    def documents():
+        for path in paths:
+            _, text = extract_pdf_text(path)
+            yield text, {"source": os.path.basename(path), "owner": OWNER}
+
+    stats = engine.ingest_many(documents())
+    stats["peak_rss_bytes"] = peak_rss_bytes()
+    return stats
+
+
+def bench_queries(engine, questions, concurrency):
+    engine.retrieval_cache.clear()
+    engine.answer_cache.clear()
+    latencies = []
+    ttfts = []
+
+    def run(question):
+        start = time.perf_counter()
+        _, tokens = engine.stream_query(question, owner=OWNER)
+        first = None
+        for _ in tokens:
+            if first is None:
+                first = time.perf_counter() - start
+        return time.perf_counter() - start, first
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for total, first in executor.map(run, questions):
+            latencies.append(total)
+            if first is not None:
+                ttfts.append(first)
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "queries_per_sec": len(questions) / elapsed if elapsed else 0.0,
+        "latency": percentiles(latencies),
+        "time_to_first_token": percentiles(ttfts),
+        "scheduler": engine.scheduler_stats(),
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def bench_crypto(workdir, size_mb):
+    from security import SecurityManager
+    security_manager = SecurityManager(os.path.join(workdir, "bench.key"))
+    path = os.path.join(workdir, "exhibit.bin")
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+    rss_before = peak_rss_bytes()
+    start = time.perf_counter()
+    security_manager.encrypt_file(path)
+    encrypt_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in security_manager.decrypt_stream(path):
+        pass
+    decrypt_s = time.perf_counter() - start
+    os.remove(path)
+    return {
+        "size_mb": size_mb,
+        "encrypt_mb_per_sec": size_mb / encrypt_s if encrypt_s else 0.0,
+        "decrypt_mb_per_sec": size_mb / decrypt_s if decrypt_s else 0.0,
+        "peak_rss_growth_bytes": peak_rss_bytes() - rss_before,
+    }
+
+
+def bench_sqlite(workdir, rows):
+    from audit import AuditWriter
+    from database import init_db, page_documents, User, Document
+
+    session_factory = init_db(f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    session = session_factory()
+    user = User(username=OWNER, password_hash=b"x")
+    session.add(user)
+    session.commit()
+
+    insert_samples = []
+    for i in range(rows):
+        start = time.perf_counter()
+        session.add(Document(filename=f"contract_{i:05d}.pdf", owner_id=user.id, encrypted_path="-"))
+        session.commit()
+        insert_samples.append(time.perf_counter() - start)
+
+    writer = AuditWriter(session_factory)
+    audit_samples = []
+    for i in range(rows):
+        start = time.perf_counter()
+        writer.log("QUERY", f"bench {i}", user.id)
+        audit_samples.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    writer.close()
+    drain_s = time.perf_counter() - start
+
+    page_samples = []
+    for term in ("contract_00", "001", "pdf"):
+        start = time.perf_counter()
+        page_documents(session, user.id, search=term)
+        page_samples.append(time.perf_counter() - start)
+    session.close()
+    return {
+        "document_insert_commit": percentiles(insert_samples),
+        "audit_log_enqueue": percentiles(audit_samples),
+        "audit_drain_s": drain_s,
+        "document_search_page": percentiles(page_samples),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", choices=sorted(corpus.SIZES), default="small")
+    parser.add_argument("--corpus-dir", help="Reuse generated PDFs from this directory")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--query-concurrency", type=int, default=4)
+    parser.add_argument("--crypto-mb", type=int, default=64)
+    parser.add_argument("--sqlite-rows", type=int, default=1000)
+    parser.add_argument("--embed-latency", type=float, default=0.005)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--embedding-backend", default="ollama",
+                        help="ollama embeds through the stand-in; sentence-transformers loads a local model")
+    parser.add_argument("--embedding-model", help="Defaults to llama3 for ollama, the backend default otherwise")
+    parser.add_argument("--vector-backend", choices=["chroma", "mmap"], default="chroma")
+    parser.add_argument("--vector-dtype", choices=["float16", "int8"], default="float16")
+    parser.add_argument("--output", default="bench-results.json")
+    args = parser.parse_args(argv)
+
+    config = FakeOllamaConfig(embed_latency=args.embed_latency, first_token_latency=args.first_token_latency,
+                              token_latency=args.token_latency, tokens=args.tokens)
+    server, base_url = start_server(config)
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        corpus_dir = args.corpus_dir or os.path.join(workdir, "corpus")
+        paths = corpus.generate(corpus_dir, args.size)
+
+        from rag_engine import RAGEngine
+        embedding_model = args.embedding_model or ("llama3" if args.embedding_backend == "ollama" else None)
+        engine = RAGEngine(persist_directory=os.path.join(workdir, "chroma_db"), base_url=base_url,
+                           embedding_backend=args.embedding_backend, embedding_model=embedding_model,
+                           vector_backend=args.vector_backend, vector_dtype=args.vector_dtype)
+        results["ingest"] = bench_ingest(engine, paths)
+
+        questions = [f"What does the {corpus.TOPICS[i % len(corpus.TOPICS)].lower()} clause of agreement "
+                     f"No. {i % len(paths):05d} say?" for i in range(args.queries)]
+        results["query"] = bench_queries(engine, questions, args.query_concurrency)
+        results["crypto"] = bench_crypto(workdir, args.crypto_mb)
+        results["sqlite"] = bench_sqlite(workdir, args.sqlite_rows)
+    server.shutdown()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "size": args.size,
+            "documents": len(paths),
+            "fake_ollama": vars(config),
+            "embeddings": f"{engine.embedding_backend}:{engine.embedding_model}",
+            "vector_store": args.vector_backend if args.vector_backend == "chroma" else f"mmap/{args.vector_dtype}",
+        },
+        "peak_rss_bytes": peak_rss_bytes(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+import math
+import os
+import pickle
+import re
+import threading
+from array import array
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking on Windows; run one writing process at a time there
+    fcntl = None
+
+# checkpoint() folds the delta log into the base snapshot once the log outgrows
+# this fraction of the snapshot (and at least MIN_CHECKPOINT_BYTES)
+CHECKPOINT_RATIO = 0.5
+MIN_CHECKPOINT_BYTES = 8 * 1024 * 1024
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+
+
+def tokenize(text):
+    """Lowercases and splits text, keeping clause numbers like 12.3 and s.21 together."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Persistent in-process BM25 inverted index over chunk IDs.
+
+    Postings are kept as compact int32 arrays per term and scored with NumPy, so a
+    query costs one vectorized pass per query term rather than a pass per chunk.
+
+    On disk the index is a base snapshot (``path``) plus an append-only log of the
+    adds and deletes made since (``path.<generation>.log``). Each write appends only
+    its own batch; ``checkpoint`` folds the log into a new snapshot when it grows
+    large. Writers in different processes serialize on ``path.lock`` and replay each
+    other's log records first, so no process overwrites another's updates.
+    """
+
+    def __init__(self, path=None, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.vocab = {}
+        self.postings_docs = []
+        self.postings_tfs = []
+        self.doc_len = array("i")
+        self.deleted = set()
+        self._id_index = {}
+        self._total_len = 0
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._generation = 0
+        self._log_offset = 0
+        self._base_stat = None
+        if path:
+            with self._write_lock, self._file_lock():
+                self._sync()
+
+    def __len__(self):
+        return len(self.ids) - len(self.deleted)
+
+    def live_ids(self):
+        with self._lock:
+            return set(self._id_index)
+
+    def add(self, ids, texts):
+        self._write(("add", list(ids), list(texts)))
+
+    def delete(self, ids):
+        self._write(("delete", list(ids)))
+
+    def _apply(self, op):
+        if op[0] == "add":
+            self._add(op[1], op[2])
+        else:
+            self._delete(op[1])
+
+    def _add(self, ids, texts):
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                if chunk_id in self._id_index:
+                    self._delete([chunk_id])
+                doc = len(self.ids)
+                self.ids.append(chunk_id)
+                self._id_index[chunk_id] = doc
+                counts = {}
+                tokens = tokenize(text)
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, tf in counts.items():
+                    term = self.vocab.get(token)
+                    if term is None:
+                        term = self.vocab[token] = len(self.postings_docs)
+                        self.postings_docs.append(array("i"))
+                        self.postings_tfs.append(array("i"))
+                    self.postings_docs[term].append(doc)
+                    self.postings_tfs[term].append(tf)
+                self.doc_len.append(len(tokens))
+                self._total_len += len(tokens)
+
+    def _delete(self, ids):
+        with self._lock:
+            for chunk_id in ids:
+                doc = self._id_index.pop(chunk_id, None)
+                if doc is not None:
+                    self.deleted.add(doc)
+                    self._total_len -= self.doc_len[doc]
+
+    def search(self, query, k=4):
+        """Returns up to k (chunk_id, score) pairs ordered by BM25 score."""
+        if self.path and self._changed():
+            # Pick up writes made by other processes
+            with self._write_lock, self._file_lock():
+                self._sync()
+        with self._lock:
+            n_docs = len(self.ids)
+            live = n_docs - len(self.deleted)
+            if not live:
+                return []
+            avgdl = self._total_len / live or 1.0
+            doc_len = np.frombuffer(self.doc_len, dtype=np.int32)
+            scores = np.zeros(n_docs, dtype=np.float32)
+            for token in set(tokenize(query)):
+                term = self.vocab.get(token)
+                if term is None:
+                    continue
+                docs = np.frombuffer(self.postings_docs[term], dtype=np.int32)
+                tfs = np.frombuffer(self.postings_tfs[term], dtype=np.int32).astype(np.float32)
+                df = len(docs)
+                idf = math.log(1.0 + (live - df + 0.5) / (df + 0.5))
+                norm = tfs + self.k1 * (1.0 - self.b + self.b * doc_len[docs] / avgdl)
+                scores[docs] += idf * tfs * (self.k1 + 1.0) / norm
+            if self.deleted:
+                scores[np.fromiter(self.deleted, dtype=np.int64)] = 0.0
+            k = min(k, n_docs)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def compact(self):
+        """Rewrites postings without deleted chunks and checkpoints the result."""
+        if not self.path:
+            self._compact()
+            return
+        with self._write_lock, self._file_lock():
+            self._sync()
+            if self._compact():
+                self._checkpoint(force=True)
+
+    def _compact(self):
+        with self._lock:
+            if not self.deleted:
+                return False
+            remap = array("i", [-1]) * len(self.ids)
+            ids = []
+            doc_len = array("i")
+            for doc, chunk_id in enumerate(self.ids):
+                if doc not in self.deleted:
+                    remap[doc] = len(ids)
+                    ids.append(chunk_id)
+                    doc_len.append(self.doc_len[doc])
+            vocab = {}
+            postings_docs = []
+            postings_tfs = []
+            for token, term in self.vocab.items():
+                docs = array("i")
+                tfs = array("i")
+                for doc, tf in zip(self.postings_docs[term], self.postings_tfs[term]):
+                    if remap[doc] >= 0:
+                        docs.append(remap[doc])
+                        tfs.append(tf)
+                if docs:
+                    vocab[token] = len(postings_docs)
+                    postings_docs.append(docs)
+                    postings_tfs.append(tfs)
+            self.ids = ids
+            self.doc_len = doc_len
+            self.vocab = vocab
+            self.postings_docs = postings_docs
+            self.postings_tfs = postings_tfs
+            self.deleted = set()
+            self._id_index = {chunk_id: doc for doc, chunk_id in enumerate(ids)}
+            return True
+
+    @property
+    def _log_path(self):
+        return f"{self.path}.{self._generation}.log"
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _changed(self):
+        if self._stat(self.path) != self._base_stat:
+            return True
+        log = self._stat(self._log_path)
+        return (log[2] if log else 0) != self._log_offset
+
+    def _write(self, op):
+        if not self.path:
+            self._apply(op)
+            return
+        with self._write_lock, self._file_lock():
+            self._sync()
+            with open(self._log_path, "ab") as f:
+                pickle.dump(op, f, protocol=pickle.HIGHEST_PROTOCOL)
+                self._log_offset = f.tell()
+            self._apply(op)
+
+    def _sync(self):
+        """Brings memory up to date with disk. The caller holds the write and file locks."""
+        if self._stat(self.path) != self._base_stat:
+            self.load()
+        try:
+            f = open(self._log_path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self._log_offset)
+            while True:
+                try:
+                    op = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError, ValueError):
+                    break
+                self._apply(op)
+                self._log_offset = f.tell()
+        # A torn record from a crashed writer is dropped so appends start on a record boundary
+        if os.path.getsize(self._log_path) > self._log_offset:
+            os.truncate(self._log_path, self._log_offset)
+
+    def _snapshot(self):
+        with self._lock:
+            return {
+                "k1": self.k1,
+                "b": self.b,
+                "ids": list(self.ids),
+                "vocab": dict(self.vocab),
+                "postings_docs": [p.tobytes() for p in self.postings_docs],
+                "postings_tfs": [p.tobytes() for p in self.postings_tfs],
+                "doc_len": self.doc_len.tobytes(),
+                "deleted": set(self.deleted),
+                "generation": self._generation + 1,
+            }
+
+    def _checkpoint(self, force):
+        base = self._stat(self.path)
+        if not force and self._log_offset < max(MIN_CHECKPOINT_BYTES, (base[2] if base else 0) * CHECKPOINT_RATIO):
+            return False
+        # Copy under the index lock, pickle outside it so searches are not blocked
+        state = self._snapshot()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        old_log = self._log_path
+        self._generation = state["generation"]
+        self._log_offset = 0
+        self._base_stat = self._stat(self.path)
+        if os.path.exists(old_log):
+            os.remove(old_log)
+        return True
+
+    def checkpoint(self, force=False):
+        """Folds the delta log into a new base snapshot if the log has grown large (or always with force)."""
+        if not self.path:
+            return False
+        with self._write_lock, self._file_lock():
+            self._sync()
+            return self._checkpoint(force)
+
+    def save(self):
+        self.checkpoint(force=True)
+
+    def load(self):
+        """Loads the base snapshot. Log records are replayed separately by _sync."""
+        base_stat = self._stat(self.path)
+        state = {}
+        if base_stat is not None:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        with self._lock:
+            self.k1 = state.get("k1", self.k1)
+            self.b = state.get("b", self.b)
+            self.ids = state.get("ids", [])
+            self.vocab = state.get("vocab", {})
+            self.postings_docs = [array("i", p) for p in state.get("postings_docs", [])]
+            self.postings_tfs = [array("i", p) for p in state.get("postings_tfs", [])]
+            self.doc_len = array("i", state.get("doc_len", b""))
+            self.deleted = state.get("deleted", set())
+            self._id_index = {chunk_id: doc for doc, chunk_id in enumerate(self.ids) if doc not in self.deleted}
+            self._total_len = sum(n for doc, n in enumerate(self.doc_len) if doc not in self.deleted)
+        self._generation = state.get("generation", 0)
+        self._log_offset = 0
+        self._base_stat = base_stat
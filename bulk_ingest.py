@@ -0,0 +1,122 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from database import init_db, User, AuditLog, Document
+from security import SecurityManager
+
+
+def extract_pdf_text(path):
+    """Extracts the text of a PDF. Runs inside a worker process."""
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return path, "".join(page.extract_text() or "" for page in reader.pages)
+
+
+def parse_bounded(executor, paths, window):
+    """Yields (path, text) in order with at most ``window`` parses in flight or waiting to be consumed,
+    so a fast parser cannot pile up the text of the whole corpus ahead of a slow embedder."""
+    paths = iter(paths)
+    pending = deque()
+    for path in paths:
+        pending.append(executor.submit(extract_pdf_text, path))
+        if len(pending) >= window:
+            break
+    while pending:
+        yield pending.popleft().result()
+        for path in paths:
+            pending.append(executor.submit(extract_pdf_text, path))
+            break
+
+
+def find_pdfs(directory):
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(".pdf"):
+                yield os.path.join(root, name)
+
+
+def store_encrypted(security_manager, path, storage_dir="storage"):
+    """Stores an encrypted copy of the PDF the same way the upload page does."""
+    os.makedirs(storage_dir, exist_ok=True)
+    encrypted_path = os.path.join(storage_dir, f"{os.path.basename(path)}.enc")
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+        tmp_path = tmp.name
+    shutil.copyfile(path, tmp_path)
+    security_manager.encrypt_file(tmp_path)
+    shutil.move(tmp_path, encrypted_path)
+    return encrypted_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import a directory of PDFs into the legal RAG index.")
+    parser.add_argument("directory", help="Directory to scan recursively for PDFs")
+    parser.add_argument("--owner", required=True, help="Username that will own the imported documents")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count(), help="Processes used to parse PDFs")
+    parser.add_argument("--embed-batch-size", type=int, default=64, help="Chunks per embedding request")
+    parser.add_argument("--write-batch-size", type=int, default=1024, help="Chunks per Chroma write and persist")
+    parser.add_argument("--concurrency", type=int, default=4, help="Embedding requests in flight")
+    args = parser.parse_args(argv)
+
+    from rag_engine import RAGEngine
+
+    session = init_db()()
+    user = session.query(User).filter_by(username=args.owner).first()
+    if user is None:
+        print(f"Unknown user: {args.owner}", file=sys.stderr)
+        return 1
+
+    security_manager = SecurityManager()
+    engine = RAGEngine()
+    paths = list(find_pdfs(args.directory))
+    if not paths:
+        print("No PDFs found.")
+        return 0
+
+    known_hashes = {h for (h,) in session.query(Document.file_hash).filter_by(owner_id=user.id) if h}
+    hashes = {}
+    for path in paths:
+        file_hash = security_manager.get_file_hash(path)
+        if file_hash not in known_hashes:
+            hashes[path] = file_hash
+            known_hashes.add(file_hash)
+    skipped = len(paths) - len(hashes)
+    paths = list(hashes)
+    if skipped:
+        print(f"Skipping {skipped} already imported PDFs.")
+    if not paths:
+        return 0
+
+    def parsed_documents(executor):
+        for path, text in parse_bounded(executor, paths, window=2 * args.parse_workers):
+            filename = os.path.basename(path)
+            encrypted_path = store_encrypted(security_manager, path)
+            document = Document(filename=filename, owner_id=user.id, encrypted_path=encrypted_path,
+                                description="Bulk imported", file_hash=hashes[path])
+            session.add(document)
+            # Commit per document so the SQLite write lock is not held for the whole import.
+            # A crash mid-run leaves committed rows without chunks; index_check.py --fix re-queues them.
+            session.commit()
+            yield text, {"source": filename, "owner": user.username, "document_id": document.id}
+
+    with ProcessPoolExecutor(max_workers=args.parse_workers) as executor:
+        stats = engine.ingest_many(
+            parsed_documents(executor),
+            embed_batch_size=args.embed_batch_size,
+            write_batch_size=args.write_batch_size,
+            max_concurrency=args.concurrency,
+        )
+
+    session.add(AuditLog(user_id=user.id, action="UPLOAD", details=f"Bulk imported {stats['docs']} documents"))
+    session.commit()
+    print(f"Ingested {stats['docs']} documents / {stats['chunks']} chunks in {stats['seconds']:.1f}s "
+          f"({stats['docs_per_sec']:.2f} docs/sec, {stats['chunks_per_sec']:.1f} chunks/sec)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
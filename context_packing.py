@@ -0,0 +1,175 @@
+import re
+import threading
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+
+TOKEN = re.compile(r"\w+|[^\w\s]")
+# Length of the leading text of a chunk searched for in its predecessor to find their overlap
+ANCHOR_CHARS = 48
+
+
+def estimate_tokens(text):
+    """Approximate LLM token count: words and punctuation marks, close to BPE counts for English prose."""
+    return len(TOKEN.findall(text))
+
+
+def _overlap_join(first, second):
+    """Joins two chunks, dropping the prefix of ``second`` that repeats the end of ``first``."""
+    anchor = second[:ANCHOR_CHARS]
+    position = first.rfind(anchor) if anchor else -1
+    if position >= 0 and second.startswith(first[position:]):
+        return first + second[len(first) - position:]
+    return f"{first}\n{second}"
+
+
+def _group_key(doc):
+    metadata = doc.metadata
+    return metadata.get("document_id", metadata.get("source")), metadata.get("owner")
+
+
+def merge_adjacent(documents):
+    """Merges chunks of the same document that overlap or are consecutive into single passages.
+
+    Passages keep the retrieval rank of their best chunk and are returned in that order.
+    """
+    groups = {}
+    for rank, doc in enumerate(documents):
+        groups.setdefault(_group_key(doc), []).append((rank, doc))
+
+    passages = []
+    for members in groups.values():
+        members.sort(key=lambda m: (m[1].metadata.get("chunk_index", m[0]), m[0]))
+        current = None
+        for rank, doc in members:
+            index = doc.metadata.get("chunk_index")
+            previous = current["last_index"] if current else None
+            if current and index is not None and previous is not None and index - previous <= 1:
+                if index != previous:
+                    current["text"] = _overlap_join(current["text"], doc.page_content)
+                current["rank"] = min(current["rank"], rank)
+                current["last_index"] = index
+                current["chunks"] += 1
+                if "page_end" in doc.metadata:
+                    current["metadata"]["page_end"] = doc.metadata["page_end"]
+                continue
+            if current:
+                passages.append(current)
+            current = {"text": doc.page_content, "rank": rank, "last_index": index, "chunks": 1,
+                       "metadata": dict(doc.metadata)}
+        passages.append(current)
+
+    passages.sort(key=lambda p: p["rank"])
+    return [Document(page_content=p["text"], metadata=dict(p["metadata"], merged_chunks=p["chunks"]))
+            for p in passages]
+
+
+def _terms(text):
+    return set(TOKEN.findall(text.lower()))
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def mmr_order(passages, mmr_lambda=0.7, max_redundancy=None):
+    """Reorders rank-ordered passages by maximal marginal relevance.
+
+    Relevance comes from the retrieval rank and redundancy from term overlap with
+    the passages already chosen, so no extra embedding calls are needed. Passages
+    whose overlap with a chosen passage exceeds ``max_redundancy`` are dropped.
+    """
+    terms = [_terms(p.page_content) for p in passages]
+    relevance = [1.0 / (1 + rank) for rank in range(len(passages))]
+    redundancy = [0.0] * len(passages)
+    remaining = list(range(len(passages)))
+    chosen = []
+    while remaining:
+        best = max(remaining, key=lambda i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy[i])
+        chosen.append(best)
+        remaining.remove(best)
+        for i in remaining:
+            redundancy[i] = max(redundancy[i], _jaccard(terms[i], terms[best]))
+        if max_redundancy is not None:
+            remaining = [i for i in remaining if redundancy[i] <= max_redundancy]
+    return [passages[i] for i in chosen]
+
+
+def _truncate(text, max_tokens):
+    """Cuts text to at most max_tokens tokens, counting the trailing ellipsis."""
+    matches = list(TOKEN.finditer(text))
+    if len(matches) <= max_tokens:
+        return text
+    keep = max_tokens - 1
+    return text[:matches[keep - 1].end()] + " …" if keep > 0 else "…"
+
+
+class PackedContext:
+    def __init__(self, text, passages, tokens, original_tokens):
+        self.text = text
+        self.passages = passages
+        self.tokens = tokens
+        self.original_tokens = original_tokens
+
+    @property
+    def saved_tokens(self):
+        return self.original_tokens - self.tokens
+
+
+class ContextPacker:
+    """Assembles the "stuff" prompt context from an over-fetched candidate pool: merges
+    overlapping chunks, orders them by MMR (dropping near-duplicates) and packs whole
+    passages into a token budget. ``record`` keeps running totals of the prompt tokens
+    saved compared with stuffing the top ``baseline_chunks`` candidates as-is, which is
+    what the chain sent before packing."""
+
+    def __init__(self, max_tokens=800, mmr_lambda=0.7, max_redundancy=0.8, baseline_chunks=4, separator="\n\n"):
+        self.max_tokens = max_tokens
+        self.mmr_lambda = mmr_lambda
+        self.max_redundancy = max_redundancy
+        self.baseline_chunks = baseline_chunks
+        self.separator = separator
+        self.queries = 0
+        self.tokens = 0
+        self.saved_tokens = 0
+        self._lock = threading.Lock()
+
+    def pack(self, documents):
+        """Selects and joins the passages for rank-ordered candidates. Deterministic and free of side effects."""
+        original_tokens = estimate_tokens(
+            self.separator.join(d.page_content for d in documents[:self.baseline_chunks]))
+        passages = mmr_order(merge_adjacent(documents), self.mmr_lambda, self.max_redundancy)
+        separator_tokens = estimate_tokens(self.separator)
+        selected = []
+        used = 0
+        for passage in passages:
+            cost = estimate_tokens(passage.page_content) + (separator_tokens if selected else 0)
+            if used + cost <= self.max_tokens:
+                selected.append(passage)
+                used += cost
+            elif not selected:
+                # Never send an empty context: cut the most relevant passage down to the budget
+                text = _truncate(passage.page_content, self.max_tokens)
+                selected.append(Document(page_content=text, metadata=passage.metadata))
+                used = estimate_tokens(text)
+        text = self.separator.join(p.page_content for p in selected)
+        return PackedContext(text, selected, estimate_tokens(text), original_tokens)
+
+    def record(self, packed):
+        """Counts a packed context that was actually sent to the LLM."""
+        with self._lock:
+            self.queries += 1
+            self.tokens += packed.tokens
+            self.saved_tokens += packed.saved_tokens
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "max_tokens": self.max_tokens,
+                "avg_prompt_tokens": self.tokens / self.queries if self.queries else 0.0,
+                "avg_saved_tokens": self.saved_tokens / self.queries if self.queries else 0.0,
+                "saved_tokens": self.saved_tokens,
+            }
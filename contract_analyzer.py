@@ -0,0 +1,214 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from langchain.prompts import PromptTemplate
+except ImportError:
+    from langchain_core.prompts import PromptTemplate
+
+try:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+except ImportError:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from tracing import tracer
+
+# Bump when CLAUSE_PROMPT changes so stale cached analyses are not reused
+PROMPT_VERSION = 1
+
+CLAUSE_PROMPT = PromptTemplate(
+    input_variables=["text"],
+    template=(
+        "You are reviewing a single clause of a contract. Identify the legal risks it creates.\n"
+        "Reply in exactly this format:\n"
+        "RISK: <high, medium, low or none>\n"
+        "ISSUES: <one or two sentences describing the risks>\n\n"
+        "Clause:\n{text}"
+    )
+)
+
+SEVERITY_RANK = {"high": 4, "medium": 3, "unknown": 2, "low": 1, "none": 0}
+
+# A clause starts at a line beginning with a section number ("7.", "7)", "7.2", "12.1.3")
+# or a label ("Section 4", "Clause 7.1", "Article IV") followed by a capitalised title.
+# Sentences that merely start with a number, such as "30 days after notice ...", do not.
+HEADING_PATTERN = re.compile(
+    r"^[ \t]*(?:(?i:section|clause|article)\s+[0-9IVXLCivxlc]+(?:\.\d+)*[.:]?|\d+(?:\.\d+)*[.)]|\d+(?:\.\d+)+)"
+    r"(?=\s+[A-Z])",
+    re.MULTILINE,
+)
+
+
+def split_clauses(text, min_chars=200, max_chars=4000):
+    """Splits contract text into clauses on section numbering.
+
+    Fragments shorter than ``min_chars`` (bare headings) are merged into the
+    following clause, and clauses longer than ``max_chars`` are split further.
+
+    >>> text = ("1. Term\\nThis agreement runs for one year.\\n"
+    ...         "30 days after notice either party may end it.\\n"
+    ...         "2.1 Payment\\nFees are due monthly.\\n"
+    ...         "12 months of records are kept.\\n"
+    ...         "Section 3 Termination\\nEither party may terminate.")
+    >>> [clause.splitlines()[0] for clause in split_clauses(text, min_chars=10)]
+    ['1. Term', '2.1 Payment', 'Section 3 Termination']
+    """
+    starts = [m.start() for m in HEADING_PATTERN.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    segments = [text[a:b].strip() for a, b in zip(starts, starts[1:] + [len(text)])]
+
+    clauses = []
+    carry = ""
+    for segment in segments:
+        if not segment:
+            continue
+        segment = f"{carry}\n{segment}" if carry else segment
+        if len(segment) < min_chars:
+            carry = segment
+            continue
+        carry = ""
+        clauses.append(segment)
+    if carry:
+        if clauses:
+            clauses[-1] = f"{clauses[-1]}\n{carry}"
+        else:
+            clauses.append(carry)
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=max_chars, chunk_overlap=0)
+    result = []
+    for clause in clauses:
+        result.extend([clause] if len(clause) <= max_chars else splitter.split_text(clause))
+    return result
+
+
+def clause_key(model_name, clause):
+    """Cache key for a clause: its text with numbering and whitespace normalised, so
+    boilerplate numbered differently in two contracts shares one entry."""
+    body = HEADING_PATTERN.sub("", clause, count=1) if HEADING_PATTERN.match(clause) else clause
+    body = re.sub(r"\s+", " ", body).strip().lower()
+    return hashlib.sha256(f"{model_name}\0{PROMPT_VERSION}\0{body}".encode("utf-8")).hexdigest()
+
+
+def parse_analysis(response):
+    """Extracts the severity and issues from a clause analysis reply."""
+    severity = re.search(r"RISK:\s*\**\s*(high|medium|low|none)", response, re.IGNORECASE)
+    issues = re.search(r"ISSUES:\s*(.+)", response, re.IGNORECASE | re.DOTALL)
+    return {
+        "severity": severity.group(1).lower() if severity else "unknown",
+        "issues": (issues.group(1) if issues else response).strip(),
+    }
+
+
+class ClauseCache:
+    """Persistent clause analysis cache keyed by clause hash."""
+
+    def __init__(self, path):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS clause_analyses (key TEXT PRIMARY KEY, analysis TEXT NOT NULL)")
+        self._conn.commit()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, analysis FROM clause_analyses WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update((key, json.loads(analysis)) for key, analysis in rows)
+        return found
+
+    def set(self, key, analysis):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO clause_analyses (key, analysis) VALUES (?, ?)",
+                               (key, json.dumps(analysis)))
+            self._conn.commit()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class ContractAnalyzer:
+    """Map-reduce contract review: clauses are analyzed concurrently, then ranked by severity.
+
+    Each distinct clause is sent to the LLM at most once per model; repeats within
+    a contract and boilerplate already seen in other contracts come from the cache.
+    LLM calls share the engine's limiter, so analysis never starves chat traffic
+    beyond its configured concurrency.
+    """
+
+    def __init__(self, llm, llm_limiter, model_name, cache_path, max_workers=4):
+        self.chain = CLAUSE_PROMPT | llm
+        self.llm_limiter = llm_limiter
+        self.model_name = model_name
+        self.cache = ClauseCache(cache_path)
+        self.max_workers = max_workers
+
+    def _analyze_clause(self, clause, parent):
+        with tracer.span("contract.clause", parent=parent, chars=len(clause)):
+            with self.llm_limiter.slot():
+                return parse_analysis(self.chain.invoke({"text": clause}))
+
+    def analyze(self, contract_text):
+        """Returns the clause risks ranked by severity and a markdown summary."""
+        with tracer.span("contract.analyze") as attrs:
+            trace = tracer.current()
+            clauses = split_clauses(contract_text)
+            keys = [clause_key(self.model_name, clause) for clause in clauses]
+            analyses = self.cache.get_many(list(set(keys)))
+            missing = {}
+            for key, clause in zip(keys, clauses):
+                if key not in analyses:
+                    missing.setdefault(key, clause)
+            self.cache.hits += len(set(keys)) - len(missing)
+            self.cache.misses += len(missing)
+
+            if missing:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    futures = {key: executor.submit(self._analyze_clause, clause, trace)
+                               for key, clause in missing.items()}
+                    for key, future in futures.items():
+                        analyses[key] = future.result()
+                        self.cache.set(key, analyses[key])
+
+            risks = []
+            for position, (key, clause) in enumerate(zip(keys, clauses)):
+                analysis = analyses[key]
+                risks.append({
+                    "clause": position + 1,
+                    "heading": clause.splitlines()[0][:80],
+                    "severity": analysis["severity"],
+                    "issues": analysis["issues"],
+                    "cached": key not in missing,
+                })
+            risks.sort(key=lambda r: (-SEVERITY_RANK[r["severity"]], r["clause"]))
+            attrs.update(clauses=len(clauses), analyzed=len(missing))
+            return {
+                "clauses": len(clauses),
+                "analyzed": len(missing),
+                "cached": len(clauses) - sum(1 for key in keys if key in missing),
+                "risks": risks,
+                "summary": self.summarize(risks),
+            }
+
+    def summarize(self, risks):
+        counts = {}
+        for risk in risks:
+            counts[risk["severity"]] = counts.get(risk["severity"], 0) + 1
+        lines = ["Risk overview: " + ", ".join(
+            f"{counts[s]} {s}" for s in sorted(counts, key=lambda s: -SEVERITY_RANK[s]))]
+        for risk in risks:
+            if risk["severity"] == "none":
+                continue
+            lines.append(f"- **{risk['severity'].upper()}** (clause {risk['clause']}: {risk['heading']}): {risk['issues']}")
+        return "\n".join(lines)
@@ -1,6 +1,11 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy import create_engine, event, inspect, select, text, and_, or_, Column, Integer, String, DateTime, Float, ForeignKey, Index
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session, relationship
+from sqlalchemy.pool import QueuePool
 import datetime
+import threading
+
+DEFAULT_DB_PATH = 'sqlite:///legal_rag.db'
 
 Base = declarative_base()
 
@@ -14,21 +19,233 @@ class User(Base):
 class AuditLog(Base):
     __tablename__ = 'audit_logs'
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
     action = Column(String, nullable=False)
-    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     details = Column(String)
+    __table_args__ = (Index('ix_audit_logs_timestamp_id', 'timestamp', 'id'),)
+
+class QueryLog(Base):
+    """One chat question and answer, linked to its QUERY audit event."""
+    __tablename__ = 'query_logs'
+    id = Column(Integer, primary_key=True)
+    audit_log_id = Column(Integer, ForeignKey('audit_logs.id'), unique=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    prompt = Column(String)
+    response = Column(String)
+    __table_args__ = (
+        Index('ix_query_logs_timestamp_id', 'timestamp', 'id'),
+        Index('ix_query_logs_user_timestamp_id', 'user_id', 'timestamp', 'id'),
+    )
+
+class QueryRef(Base):
+    """A document cited in a query's answer."""
+    __tablename__ = 'query_refs'
+    query_log_id = Column(Integer, ForeignKey('query_logs.id'), primary_key=True)
+    source = Column(String, primary_key=True)
+    document_id = Column(Integer, ForeignKey('documents.id'), index=True)
+    __table_args__ = (Index('ix_query_refs_source_query', 'source', 'query_log_id'),)
 
 class Document(Base):
     __tablename__ = 'documents'
     id = Column(Integer, primary_key=True)
-    filename = Column(String, nullable=False)
+    filename = Column(String, nullable=False, index=True)
     upload_date = Column(DateTime, default=datetime.datetime.utcnow)
-    owner_id = Column(Integer, ForeignKey('users.id'))
+    owner_id = Column(Integer, ForeignKey('users.id'), index=True)
     encrypted_path = Column(String, nullable=False)
     description = Column(String, default="No description available.")
+    file_hash = Column(String, index=True)
+
+class IngestJob(Base):
+    __tablename__ = 'ingest_jobs'
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey('documents.id'), index=True, nullable=False)
+    owner = Column(String, nullable=False)
+    status = Column(String, default='queued', index=True)  # queued, running, done, failed
+    progress = Column(Float, default=0.0)
+    attempts = Column(Integer, default=0)
+    error = Column(String)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+def _add_missing_columns(engine):
+    """Adds columns introduced after a table was first created (create_all only creates tables)."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    col_type = column.type.compile(engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+
+def _create_missing_indexes(engine):
+    """Creates indexes declared after a table was first created."""
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+# Engine URL -> 'trigram' (substring search) or 'unicode61' (word prefix search)
+_fts_modes = {}
+
+def _create_filename_fts(engine):
+    """Maintains an FTS5 index over documents.filename through triggers."""
+    with engine.begin() as conn:
+        row = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'documents_fts'")).first()
+        if row is None:
+            try:
+                conn.execute(text("CREATE VIRTUAL TABLE documents_fts USING fts5("
+                                  "filename, content='documents', content_rowid='id', tokenize='trigram')"))
+            except OperationalError:
+                # SQLite older than 3.34 has no trigram tokenizer
+                conn.execute(text("CREATE VIRTUAL TABLE documents_fts USING fts5("
+                                  "filename, content='documents', content_rowid='id')"))
+            conn.execute(text("INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')"))
+            row = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'documents_fts'")).first()
+        conn.execute(text("""CREATE TRIGGER IF NOT EXISTS documents_fts_ai AFTER INSERT ON documents BEGIN
+            INSERT INTO documents_fts(rowid, filename) VALUES (new.id, new.filename);
+        END"""))
+        conn.execute(text("""CREATE TRIGGER IF NOT EXISTS documents_fts_ad AFTER DELETE ON documents BEGIN
+            INSERT INTO documents_fts(documents_fts, rowid, filename) VALUES ('delete', old.id, old.filename);
+        END"""))
+        conn.execute(text("""CREATE TRIGGER IF NOT EXISTS documents_fts_au AFTER UPDATE OF filename ON documents BEGIN
+            INSERT INTO documents_fts(documents_fts, rowid, filename) VALUES ('delete', old.id, old.filename);
+            INSERT INTO documents_fts(rowid, filename) VALUES (new.id, new.filename);
+        END"""))
+    _fts_modes[str(engine.url)] = 'trigram' if 'trigram' in row[0] else 'unicode61'
+
+def _enable_wal(dbapi_connection, connection_record):
+    """Lets readers proceed while a writer commits, and makes commits cheaper."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+_engines = {}
+_scoped_sessions = {}
+_engines_lock = threading.Lock()
+
+def get_engine(db_path=DEFAULT_DB_PATH):
+    """Returns the process-wide pooled engine for db_path, creating and migrating it once."""
+    with _engines_lock:
+        engine = _engines.get(db_path)
+        if engine is None:
+            engine = create_engine(db_path, poolclass=QueuePool, pool_size=10, max_overflow=20, pool_pre_ping=True)
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, "connect", _enable_wal)
+            _add_missing_columns(engine)
+            Base.metadata.create_all(engine)
+            _create_missing_indexes(engine)
+            if engine.dialect.name == 'sqlite':
+                _create_filename_fts(engine)
+            _engines[db_path] = engine
+        return engine
+
+def init_db(db_path=DEFAULT_DB_PATH):
+    return sessionmaker(bind=get_engine(db_path))
+
+def get_scoped_session(db_path=DEFAULT_DB_PATH):
+    """Thread-local session registry on the shared engine. Call .remove() when a request ends."""
+    with _engines_lock:
+        registry = _scoped_sessions.get(db_path)
+    if registry is None:
+        registry = scoped_session(init_db(db_path))
+        with _engines_lock:
+            registry = _scoped_sessions.setdefault(db_path, registry)
+    return registry
+
+def _filter_filename(session, query, search):
+    mode = _fts_modes.get(str(session.get_bind().url))
+    if mode == 'trigram' and len(search) >= 3:
+        match = '"' + search.replace('"', '""') + '"'
+    elif mode == 'unicode61' and search.strip():
+        match = " ".join('"' + word.replace('"', '""') + '"*' for word in search.split())
+    else:
+        return query.filter(Document.filename.contains(search))
+    return query.filter(text("documents.id IN (SELECT rowid FROM documents_fts WHERE documents_fts MATCH :fts_match)"))\
+        .params(fts_match=match)
+
+def page_documents(session, owner_id, search=None, after_id=None, limit=24):
+    """Returns one page of a user's documents, newest first, and the cursor for the next page."""
+    query = session.query(Document).filter(Document.owner_id == owner_id)
+    if search:
+        query = _filter_filename(session, query, search)
+    if after_id is not None:
+        query = query.filter(Document.id < after_id)
+    docs = query.order_by(Document.id.desc()).limit(limit + 1).all()
+    next_cursor = docs[limit - 1].id if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+def page_audit_logs(session, before=None, limit=50):
+    """Returns one page of (AuditLog, username) rows, newest first, and the cursor for the next page."""
+    query = session.query(AuditLog, User.username).join(User, AuditLog.user_id == User.id)
+    if before is not None:
+        timestamp, log_id = before
+        query = query.filter(or_(
+            AuditLog.timestamp < timestamp,
+            and_(AuditLog.timestamp == timestamp, AuditLog.id < log_id)
+        ))
+    rows = query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1][0]
+        next_cursor = (last.timestamp, last.id)
+    return rows[:limit], next_cursor
+
+def filter_query_logs(query, user_id=None, start=None, end=None, source=None, document_id=None):
+    """Applies the query log filters; start is inclusive and end exclusive."""
+    if user_id is not None:
+        query = query.filter(QueryLog.user_id == user_id)
+    if start is not None:
+        query = query.filter(QueryLog.timestamp >= start)
+    if end is not None:
+        query = query.filter(QueryLog.timestamp < end)
+    if source is not None or document_id is not None:
+        refs = select(QueryRef.query_log_id)
+        if source is not None:
+            refs = refs.where(QueryRef.source == source)
+        if document_id is not None:
+            refs = refs.where(QueryRef.document_id == document_id)
+        query = query.filter(QueryLog.id.in_(refs))
+    return query
+
+def page_query_logs(session, before=None, limit=50, **filters):
+    """Returns one page of (QueryLog, username, refs) rows, newest first, and the cursor for the next page."""
+    query = filter_query_logs(
+        session.query(QueryLog, User.username).join(User, QueryLog.user_id == User.id), **filters)
+    if before is not None:
+        timestamp, log_id = before
+        query = query.filter(or_(
+            QueryLog.timestamp < timestamp,
+            and_(QueryLog.timestamp == timestamp, QueryLog.id < log_id)
+        ))
+    rows = query.order_by(QueryLog.timestamp.desc(), QueryLog.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1][0]
+        next_cursor = (last.timestamp, last.id)
+    rows = rows[:limit]
+    refs = query_refs(session, [log.id for log, _ in rows])
+    return [(log, username, refs.get(log.id, [])) for log, username in rows], next_cursor
+
+def query_refs(session, query_log_ids):
+    """Maps each query log ID to the sources it cited."""
+    refs = {}
+    if query_log_ids:
+        for ref in session.query(QueryRef).filter(QueryRef.query_log_id.in_(query_log_ids)):
+            refs.setdefault(ref.query_log_id, []).append(ref.source)
+    return refs
 
-def init_db(db_path='sqlite:///legal_rag.db'):
-    engine = create_engine(db_path)
-    Base.metadata.create_all(engine)
-    return sessionmaker(bind=engine)
+def query_logs_for_audit(session, audit_log_ids):
+    """Maps QUERY audit event IDs to their (QueryLog, refs)."""
+    if not audit_log_ids:
+        return {}
+    logs = session.query(QueryLog).filter(QueryLog.audit_log_id.in_(audit_log_ids)).all()
+    refs = query_refs(session, [log.id for log in logs])
+    return {log.audit_log_id: (log, refs.get(log.id, [])) for log in logs}
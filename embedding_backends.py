@@ -0,0 +1,93 @@
+import json
+import os
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:
+    from langchain.embeddings.base import Embeddings
+
+DEFAULT_BACKEND = "sentence-transformers"
+DEFAULT_MODELS = {
+    "sentence-transformers": "sentence-transformers/all-MiniLM-L6-v2",
+    "ollama": "nomic-embed-text",
+}
+MARKER_FILE = "embedding_model.json"
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """Local sentence-transformers model, encoding in batches on CPU by default."""
+
+    def __init__(self, model_name=DEFAULT_MODELS["sentence-transformers"], device="cpu", batch_size=64):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device=device)
+
+    def _encode(self, texts):
+        if not texts:
+            return []
+        vectors = self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                    convert_to_numpy=True, show_progress_bar=False)
+        return vectors.tolist()
+
+    def embed_documents(self, texts):
+        return self._encode(list(texts))
+
+    def embed_query(self, text):
+        return self._encode([text])[0]
+
+    def embed_queries(self, texts):
+        return self._encode(list(texts))
+
+
+def create_embeddings(backend, model, base_url=None):
+    """Builds the embedding client for a backend name."""
+    if backend == "sentence-transformers":
+        return SentenceTransformerEmbeddings(model)
+    if backend == "ollama":
+        from langchain_community.embeddings import OllamaEmbeddings
+        return OllamaEmbeddings(model=model, base_url=base_url)
+    raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {sorted(DEFAULT_MODELS)}")
+
+
+def read_marker(persist_directory):
+    path = os.path.join(persist_directory, MARKER_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_marker(persist_directory, backend, model):
+    path = os.path.join(persist_directory, MARKER_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"backend": backend, "model": model}, f)
+    os.replace(path + ".tmp", path)
+
+
+def resolve_embedding_config(persist_directory, backend=None, model=None, legacy_model=None):
+    """Returns the (backend, model) a vector store must be opened with.
+
+    A store remembers the embedding model it was built with. Opening it with a
+    different one would mix vector spaces, so that raises until the store has been
+    re-embedded with reembed.py. Stores created before the marker existed were
+    embedded by Ollama with the generation model (``legacy_model``).
+    """
+    backend = backend or os.environ.get("RAG_EMBEDDING_BACKEND")
+    model = model or os.environ.get("RAG_EMBEDDING_MODEL")
+    stored = read_marker(persist_directory)
+    if stored is None and legacy_model and os.path.exists(os.path.join(persist_directory, "chroma.sqlite3")):
+        stored = {"backend": "ollama", "model": legacy_model}
+        write_marker(persist_directory, stored["backend"], stored["model"])
+    if stored is not None:
+        if backend and backend != stored["backend"] or model and model != stored["model"]:
+            raise ValueError(
+                f"{persist_directory} was embedded with {stored['backend']}:{stored['model']}; "
+                f"run `python reembed.py --persist-directory {persist_directory} --backend {backend or stored['backend']}"
+                f"{' --model ' + model if model else ''}` to switch embedding models"
+            )
+        return stored["backend"], stored["model"]
+    backend = backend or DEFAULT_BACKEND
+    model = model or DEFAULT_MODELS.get(backend)
+    write_marker(persist_directory, backend, model)
+    return backend, model
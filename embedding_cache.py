@@ -0,0 +1,86 @@
+import hashlib
+import sqlite3
+import threading
+from array import array
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:
+    from langchain.embeddings.base import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embeddings client with a persistent, content-addressed vector cache.
+
+    Vectors are keyed by SHA-256 of the embedding model name and the text, so an
+    identical chunk is only ever embedded once per model.
+    """
+
+    def __init__(self, embeddings, model_name, path):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    def _key(self, text, kind="document"):
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys):
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def _store(self, items):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items],
+            )
+            self._conn.commit()
+
+    def _embed_cached(self, texts, kind, compute):
+        keys = [self._key(text, kind) for text in texts]
+        found = self._lookup(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.hits += len(keys) - sum(1 for key in keys if key in missing)
+        self.misses += len(missing)
+        if missing:
+            computed = list(zip(missing.keys(), compute(list(missing.values()))))
+            self._store(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts):
+        return self._embed_cached(texts, "document", self.embeddings.embed_documents)
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts):
+        """Embeds several queries at once, batching the misses when the backend supports it."""
+        # Query embeddings may use a different instruction prefix, so they get their own keys
+        if hasattr(self.embeddings, "embed_queries"):
+            compute = self.embeddings.embed_queries
+        else:
+            compute = lambda batch: [self.embeddings.embed_query(text) for text in batch]
+        return self._embed_cached(texts, "query", compute)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,128 @@
+import argparse
+import sys
+
+from database import init_db, Document, IngestJob, User
+from ingest_queue import enqueue_ingest
+
+
+def stored_chunks(partition, page_size=5000):
+    """Yields (chunk_id, metadata) for every vector in a partition."""
+    offset = 0
+    while True:
+        page = partition.vector_store._collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        offset += len(page["ids"])
+        for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+            yield chunk_id, metadata or {}
+
+
+def stamp_document_ids(partition, chunk_ids, document_id, page_size=500):
+    """Adds document_id to chunks indexed before chunks carried one, keeping their stored embeddings."""
+    for start in range(0, len(chunk_ids), page_size):
+        batch = partition.vector_store._collection.get(
+            ids=chunk_ids[start:start + page_size], include=["documents", "metadatas", "embeddings"])
+        partition.vector_store._collection.upsert(
+            ids=batch["ids"],
+            embeddings=[list(embedding) for embedding in batch["embeddings"]],
+            documents=batch["documents"],
+            metadatas=[dict(metadata or {}, document_id=document_id) for metadata in batch["metadatas"]],
+        )
+    partition.vector_store.persist()
+
+
+def check_owner(session, engine, user, fix=False):
+    """Reconciles one owner's documents table rows with their vector partition."""
+    partition = engine.partition(user.username)
+    chunk_ids = set()
+    chunks_by_document = {}
+    untracked = {}
+    for chunk_id, metadata in stored_chunks(partition):
+        chunk_ids.add(chunk_id)
+        document_id = metadata.get("document_id")
+        if document_id is None:
+            untracked.setdefault(metadata.get("source"), []).append(chunk_id)
+        else:
+            chunks_by_document[document_id] = chunks_by_document.get(document_id, 0) + 1
+
+    documents = {doc.id: doc for doc in session.query(Document).filter_by(owner_id=user.id)}
+    latest_status = {document_id: status for document_id, status in session.query(IngestJob.document_id, IngestJob.status)
+                     .filter(IngestJob.document_id.in_(documents)).order_by(IngestJob.id)}
+    # Queued or running jobs are still to write their chunks; a done job with no chunks
+    # means the PDF has no text layer (e.g. a scan), and re-queueing it cannot help
+    not_missing = {document_id for document_id, status in latest_status.items() if status in ('queued', 'running', 'done')}
+    # Untracked chunks belong to the newest document with their filename; without one they are orphans
+    by_filename = {}
+    for doc in sorted(documents.values(), key=lambda doc: doc.id):
+        by_filename[doc.filename] = doc.id
+    for source, ids in untracked.items():
+        if source in by_filename:
+            chunks_by_document[by_filename[source]] = chunks_by_document.get(by_filename[source], 0) + len(ids)
+    orphaned = sorted(set(chunks_by_document) - set(documents))
+    unindexed = sorted(set(documents) - set(chunks_by_document) - not_missing)
+
+    lexical_ids = partition.lexical_index.live_ids()
+    lexical_only = sorted(lexical_ids - chunk_ids)
+    vector_only = sorted(chunk_ids - lexical_ids)
+
+    report = {
+        "owner": user.username,
+        "documents": len(documents),
+        "chunks": len(chunk_ids),
+        "orphaned_documents": orphaned,
+        "unindexed_documents": unindexed,
+        "untracked_chunks": sum(len(ids) for ids in untracked.values()),
+        "lexical_only_chunks": len(lexical_only),
+        "vector_only_chunks": len(vector_only),
+    }
+
+    if fix:
+        for source, ids in untracked.items():
+            if source in by_filename:
+                stamp_document_ids(partition, ids, by_filename[source])
+            else:
+                engine._delete_chunks(partition, ids)
+        if untracked:
+            engine.bump_corpus_version(user.username)
+        for document_id in orphaned:
+            engine.delete_document(document_id, owner=user.username)
+        for document_id in unindexed:
+            enqueue_ingest(session, documents[document_id], user.username)
+        if lexical_only:
+            partition.lexical_index.delete(lexical_only)
+        for start in range(0, len(vector_only), 1000):
+            batch = partition.vector_store._collection.get(ids=vector_only[start:start + 1000], include=["documents"])
+            partition.lexical_index.add(batch["ids"], batch["documents"])
+        engine.compact(user.username)
+        session.commit()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the documents table and the vector store agree.")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--fix", action="store_true",
+                        help="Delete orphaned vectors, queue unindexed documents, stamp document IDs on "
+                             "untracked chunks and rebuild lexical drift")
+    args = parser.parse_args(argv)
+
+    from rag_engine import RAGEngine
+    engine = RAGEngine(persist_directory=args.persist_directory)
+    session = init_db()()
+    clean = True
+    for user in session.query(User).order_by(User.id):
+        report = check_owner(session, engine, user, fix=args.fix)
+        problems = (report["orphaned_documents"] or report["unindexed_documents"] or report["untracked_chunks"]
+                    or report["lexical_only_chunks"] or report["vector_only_chunks"])
+        clean = clean and not problems
+        status = "OK" if not problems else ("FIXED" if args.fix else "MISMATCH")
+        print(f"[{status}] {report['owner']}: {report['documents']} documents, {report['chunks']} chunks, "
+              f"{len(report['orphaned_documents'])} orphaned, {len(report['unindexed_documents'])} unindexed, "
+              f"{report['untracked_chunks']} untracked, {report['lexical_only_chunks']} lexical-only, "
+              f"{report['vector_only_chunks']} vector-only")
+    session.close()
+    return 0 if clean or args.fix else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
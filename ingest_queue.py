@@ -0,0 +1,201 @@
+import datetime
+import io
+import logging
+import threading
+import time
+
+from sqlalchemy import update
+
+from database import IngestJob, Document
+from streaming_splitter import iter_pdf_pages, open_pdf
+from tracing import timed_iter, tracer
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentDeleted(Exception):
+    """The document of a running job was deleted; indexing stops."""
+
+
+def enqueue_ingest(session, document, owner):
+    """Adds an ingestion job for a stored document. The caller commits."""
+    job = IngestJob(document_id=document.id, owner=owner)
+    session.add(job)
+    return job
+
+
+class IngestWorker:
+    """Background threads that index uploaded documents from the ingest_jobs table.
+
+    Jobs survive restarts because the queue lives in the database. A failed job is
+    retried with exponential backoff until ``max_attempts`` is reached.
+    """
+
+    def __init__(self, session_factory, security_manager, rag_engine, num_threads=2, poll_interval=2.0, max_attempts=3):
+        self.session_factory = session_factory
+        self.security_manager = security_manager
+        self.rag_engine = rag_engine
+        self.num_threads = num_threads
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._uploads = {}
+        self._uploads_lock = threading.Lock()
+
+    def start(self):
+        self._requeue_interrupted()
+        for i in range(self.num_threads):
+            thread = threading.Thread(target=self._run, name=f"ingest-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stage(self, job_id, data):
+        """Holds the uploaded bytes for a job so it can skip decrypting the stored copy.
+
+        Call before committing the job: a worker may claim it as soon as it is committed.
+        """
+        with self._uploads_lock:
+            self._uploads[job_id] = data
+
+    def discard(self, job_id):
+        with self._uploads_lock:
+            self._uploads.pop(job_id, None)
+
+    def submit(self, job_id, data=None):
+        """Wakes the workers, staging the uploaded bytes first if given."""
+        if data is not None:
+            self.stage(job_id, data)
+        self._wake.set()
+
+    def _requeue_interrupted(self):
+        session = self.session_factory()
+        try:
+            session.execute(update(IngestJob).where(IngestJob.status == 'running').values(status='queued'))
+            session.commit()
+        finally:
+            session.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = None
+            session = self.session_factory()
+            try:
+                job = self._claim(session)
+                if job is not None:
+                    self._process(session, job)
+            except Exception:
+                logger.exception("Ingest worker iteration failed")
+            finally:
+                session.close()
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _claim(self, session):
+        now = datetime.datetime.utcnow()
+        candidate = session.query(IngestJob.id)\
+            .filter(IngestJob.status == 'queued', IngestJob.next_attempt_at <= now)\
+            .order_by(IngestJob.id).first()
+        if candidate is None:
+            return None
+        # Conditional update so two threads never claim the same job
+        claimed = session.execute(
+            update(IngestJob)
+            .where(IngestJob.id == candidate.id, IngestJob.status == 'queued')
+            .values(status='running', attempts=IngestJob.attempts + 1, progress=0.0, updated_at=now)
+        ).rowcount
+        session.commit()
+        if not claimed:
+            return None
+        return session.get(IngestJob, candidate.id)
+
+    def _set_progress(self, session, job, progress):
+        job.progress = progress
+        job.updated_at = datetime.datetime.utcnow()
+        session.commit()
+
+    def _document_exists(self, session, document_id):
+        # Queried rather than session.get, which would answer from the identity map
+        return session.query(Document.id).filter_by(id=document_id).scalar() is not None
+
+    def _process(self, session, job):
+        with tracer.span("ingest.job", job_id=job.id, attempt=job.attempts):
+            self._run_job(session, job)
+
+    def _run_job(self, session, job):
+        # Taken before anything can fail so staged bytes never outlive the attempt;
+        # a retry decrypts the stored copy instead
+        with self._uploads_lock:
+            data = self._uploads.pop(job.id, None)
+        document_id, owner = job.document_id, job.owner
+        try:
+            document = session.get(Document, document_id)
+            if document is None:
+                raise DocumentDeleted(document_id)
+            # Pages are read and indexed lazily, so only the current page and one
+            # embedding batch of chunks are in memory besides the PDF source itself.
+            # Decryption and parsing are interleaved with indexing, so their time is
+            # accumulated and recorded as one span each per document.
+            timings = {}
+            start = time.perf_counter()
+            if data is not None:
+                source = io.BytesIO(data)
+            else:
+                source = self.security_manager.open_decrypted(document.encrypted_path)
+            timings["decrypt"] = time.perf_counter() - start
+            try:
+                with tracer.span("ingest.index") as attrs:
+                    start = time.perf_counter()
+                    reader = open_pdf(source)
+                    total = len(reader.pages)
+                    timings["parse"] = time.perf_counter() - start
+                    attrs["pages"] = total
+
+                    def pages():
+                        for number, text in timed_iter(iter_pdf_pages(reader), timings, "parse"):
+                            # Checked per page so a delete stops indexing before the next batch is written
+                            if not self._document_exists(session, document_id):
+                                raise DocumentDeleted(document_id)
+                            yield number, text
+                            if number % 10 == 0 or number == total:
+                                self._set_progress(session, job, 0.95 * number / total)
+
+                    attrs.update(self.rag_engine.ingest_pages(
+                        pages(),
+                        {"source": document.filename, "owner": job.owner, "document_id": document.id}
+                    ))
+                    # Frames of a stored file are decrypted on demand while pypdf reads
+                    decrypted_in_reads = getattr(getattr(source, "raw", None), "decrypt_seconds", 0.0)
+                    tracer.record_span("ingest.decrypt", timings["decrypt"] + decrypted_in_reads,
+                                       stored=data is None)
+                    tracer.record_span("ingest.parse", timings["parse"] - decrypted_in_reads, pages=total)
+            finally:
+                source.close()
+                del data
+            job.status = 'done'
+            job.error = None
+            self._set_progress(session, job, 1.0)
+        except Exception as e:
+            session.rollback()
+            if isinstance(e, DocumentDeleted) or not self._document_exists(session, document_id):
+                # Deleted while indexing (its job row goes with it): remove any chunks
+                # written after the delete handler cleaned up
+                self.rag_engine.delete_document(document_id, owner=owner)
+                return
+            job.error = f"{type(e).__name__}: {e}"
+            if job.attempts < self.max_attempts:
+                job.status = 'queued'
+                job.next_attempt_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=2 ** job.attempts)
+            else:
+                job.status = 'failed'
+            job.updated_at = datetime.datetime.utcnow()
+            session.commit()
@@ -0,0 +1,89 @@
+import argparse
+import sys
+
+from rag_engine import RAGEngine
+
+
+def migrate(engine, page_size=1000, drop_source=False):
+    """Copies chunks from the legacy shared collection into per-owner partitions.
+
+    Embeddings are copied as stored, so nothing is re-embedded. Chunks without an
+    owner stay in the shared collection.
+    """
+    source = engine.partition(None)
+    counts = {}
+    offset = 0
+    while True:
+        page = source.vector_store._collection.get(
+            include=["documents", "metadatas", "embeddings"],
+            limit=page_size,
+            offset=offset,
+        )
+        if not page["ids"]:
+            break
+        offset += len(page["ids"])
+        grouped = {}
+        for chunk_id, text, metadata, embedding in zip(page["ids"], page["documents"], page["metadatas"], page["embeddings"]):
+            owner = (metadata or {}).get("owner")
+            if owner is None:
+                continue
+            buffer = grouped.setdefault(owner, {"ids": [], "texts": [], "embeddings": [], "metadatas": []})
+            buffer["ids"].append(chunk_id)
+            buffer["texts"].append(text)
+            buffer["embeddings"].append(list(embedding))
+            buffer["metadatas"].append(metadata)
+        for owner, buffer in grouped.items():
+            counts[owner] = counts.get(owner, 0) + engine._write_batch(engine.partition(owner), buffer)
+
+    for owner in counts:
+        engine.partition(owner).lexical_index.checkpoint()
+
+    if drop_source and counts:
+        migrated = source.vector_store._collection.get(where={"owner": {"$ne": ""}}, include=[])["ids"]
+        for start in range(0, len(migrated), page_size):
+            batch = migrated[start:start + page_size]
+            source.vector_store._collection.delete(ids=batch)
+            source.lexical_index.delete(batch)
+        source.lexical_index.compact()
+        source.vector_store.persist()
+    for owner in counts:
+        engine.bump_corpus_version(owner)
+    engine.bump_corpus_version(None)
+    return counts
+
+
+def has_legacy_chunks(engine):
+    """True if the shared collection still holds chunks that belong to an owner (not yet migrated)."""
+    found = engine.partition(None).vector_store._collection.get(where={"owner": {"$ne": ""}}, limit=1, include=[])
+    return bool(found["ids"])
+
+
+def migrate_legacy(engine, page_size=1000):
+    """Moves owned chunks out of the shared collection if any are left there. Run at startup.
+
+    The source is dropped after copying so later startups find nothing to do.
+    Returns chunk counts per owner.
+    """
+    if not has_legacy_chunks(engine):
+        return {}
+    return migrate(engine, page_size=page_size, drop_source=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split the shared Chroma collection into per-owner partitions.")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--drop-source", action="store_true",
+                        help="Delete migrated chunks from the shared collection afterwards")
+    args = parser.parse_args(argv)
+
+    engine = RAGEngine(persist_directory=args.persist_directory)
+    counts = migrate(engine, page_size=args.page_size, drop_source=args.drop_source)
+    for owner, count in sorted(counts.items()):
+        print(f"{owner}: {count} chunks")
+    print(f"Migrated {sum(counts.values())} chunks into {len(counts)} partitions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
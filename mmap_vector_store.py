@@ -0,0 +1,372 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+
+DTYPES = ("float16", "int8")
+# Rows scored per NumPy pass, bounding the float32 working copy during a full scan
+BLOCK_ROWS = 65536
+COMPARISONS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+# Metadata keys copied into indexed columns of the chunks table; filters on them skip json_extract
+INDEXED_FIELDS = ("document_id",)
+
+
+def where_clause(where):
+    """Translates a Chroma-style metadata filter into SQL over the metadata sidecar."""
+    if "$and" in where or "$or" in where:
+        op = "$and" if "$and" in where else "$or"
+        parts = [where_clause(w) for w in where[op]]
+        joiner = " AND " if op == "$and" else " OR "
+        return "(" + joiner.join(sql for sql, _ in parts) + ")", [p for _, params in parts for p in params]
+    clauses, params = [], []
+    for key, condition in where.items():
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        if key in INDEXED_FIELDS:
+            field, path = key, []
+        else:
+            field, path = "json_extract(metadata, ?)", [f'$."{key}"']
+        for op, value in condition.items():
+            if op in ("$in", "$nin"):
+                placeholders = ",".join("?" * len(value))
+                clauses.append(f"{field} {'NOT IN' if op == '$nin' else 'IN'} ({placeholders})")
+                params.extend([*path, *value])
+            elif op in COMPARISONS:
+                clauses.append(f"{field} {COMPARISONS[op]} ?")
+                params.extend([*path, value])
+            else:
+                raise ValueError(f"Unsupported filter operator {op!r}")
+    return "(" + " AND ".join(clauses or ["1"]) + ")", params
+
+
+def _normalized(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class MmapVectorStore:
+    """Append-only vector store: quantized vectors in a memory-mapped file, metadata in SQLite.
+
+    Vectors are L2-normalised and stored as float16, or as int8 with a float32
+    scale per row, and searched by cosine similarity with blockwise NumPy scans.
+    Chunk IDs, texts and metadata live in a SQLite sidecar that also evaluates
+    Chroma-style ``where`` filters before scoring. Upserts and deletes append rows
+    and set tombstones; ``compact`` rewrites the live rows.
+
+    Opening a store reads no vectors, and read-only maps let every worker process
+    share the same pages through the OS page cache. The row count and tombstone
+    mask are kept up to date in memory by this process's writes; commits from other
+    processes are detected via SQLite's data_version and trigger a full reload.
+    One process should write at a time.
+
+    The class serves both the LangChain wrapper calls (``get``,
+    ``similarity_search_by_vector``, ``persist``) and the collection calls
+    (``_collection.get/upsert/delete``) that RAGEngine makes on a Chroma store.
+    """
+
+    def __init__(self, directory, dtype="float16"):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(directory, "metadata.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                document TEXT,
+                metadata TEXT,
+                deleted INTEGER NOT NULL DEFAULT 0,
+                document_id
+            );
+        """)
+        if "document_id" not in {column for _, column, *_ in self._conn.execute("PRAGMA table_info(chunks)")}:
+            # Stores created before document_id was promoted to a column
+            with self._conn:
+                self._conn.execute("ALTER TABLE chunks ADD COLUMN document_id")
+                self._conn.execute("""UPDATE chunks SET document_id = json_extract(metadata, '$."document_id"')""")
+        self._conn.executescript("""
+            CREATE INDEX IF NOT EXISTS ix_chunks_live_id ON chunks (id) WHERE deleted = 0;
+            CREATE INDEX IF NOT EXISTS ix_chunks_live_document ON chunks (document_id) WHERE deleted = 0;
+            CREATE INDEX IF NOT EXISTS ix_chunks_tombstones ON chunks (row) WHERE deleted = 1;
+        """)
+        with self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO info (key, value) VALUES ('dtype', ?)", (dtype,))
+            self._conn.execute("INSERT OR IGNORE INTO info (key, value) VALUES ('generation', '0')")
+        self.dim = None
+        self.dtype = dtype
+        self.generation = 0
+        self._data_version = None
+        self._count = 0
+        self._tombstones = 0
+        self._vectors = None
+        self._scales = None
+        self._deleted = np.zeros(0, dtype=bool)
+        self._refresh(force=True)
+
+    @property
+    def _collection(self):
+        return self
+
+    def _path(self, name, generation=None):
+        return os.path.join(self.directory, f"{name}.{self.generation if generation is None else generation}.bin")
+
+    def _refresh(self, force=False):
+        """Re-maps the files if this or another process committed since the last look."""
+        with self._lock:
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if not force and version == self._data_version:
+                return
+            self._data_version = version
+            info = dict(self._conn.execute("SELECT key, value FROM info"))
+            self.dtype = info["dtype"]
+            self.generation = int(info["generation"])
+            self.dim = int(info["dim"]) if "dim" in info else None
+            self._count = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM chunks").fetchone()[0]
+            self._map()
+            deleted = np.zeros(self._count, dtype=bool)
+            rows = [row for (row,) in self._conn.execute("SELECT row FROM chunks WHERE deleted = 1")]
+            deleted[rows] = True
+            self._deleted = deleted
+            self._tombstones = len(rows)
+
+    def _map(self):
+        if self._count and self.dim:
+            self._vectors = np.memmap(self._path("vectors"), dtype=self.dtype, mode="r", shape=(self._count, self.dim))
+            if self.dtype == "int8":
+                self._scales = np.memmap(self._path("scales"), dtype=np.float32, mode="r", shape=(self._count,))
+        else:
+            self._vectors = self._scales = None
+
+    def _live_rows(self, ids):
+        rows = []
+        for start in range(0, len(ids), 500):
+            batch = list(ids[start:start + 500])
+            rows += [row for (row,) in self._conn.execute(
+                f"SELECT row FROM chunks WHERE deleted = 0 AND id IN ({','.join('?' * len(batch))})", batch)]
+        return rows
+
+    def _tombstone(self, rows):
+        """Marks rows deleted in the open transaction and in the in-memory mask."""
+        self._conn.executemany("UPDATE chunks SET deleted = 1 WHERE row = ?", [(row,) for row in rows])
+        self._deleted[rows] = True
+        self._tombstones += len(rows)
+
+    def _encode(self, matrix):
+        if self.dtype == "float16":
+            return matrix.astype(np.float16), None
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _decode(self, vectors, scales, rows):
+        block = np.asarray(vectors[rows], dtype=np.float32)
+        return block * scales[rows][:, None] if scales is not None else block
+
+    def _append(self, name, values, start_row):
+        # Truncating first drops rows a crashed writer appended but never committed
+        row_bytes = values.itemsize * (values.shape[1] if values.ndim == 2 else 1)
+        with open(self._path(name), "ab") as f:
+            f.truncate(start_row * row_bytes)
+            f.write(values.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        """Appends new versions of the given chunks and tombstones any previous ones."""
+        if not ids:
+            return
+        latest = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        order = sorted(latest.values())
+        matrix = _normalized(np.asarray([embeddings[i] for i in order], dtype=np.float32))
+        with self._lock:
+            self._refresh()
+            if self.dim is None:
+                with self._conn:
+                    self._conn.execute("INSERT INTO info (key, value) VALUES ('dim', ?)", (str(matrix.shape[1]),))
+                self.dim = matrix.shape[1]
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match the store's {self.dim}")
+            vectors, scales = self._encode(matrix)
+            start = self._count
+            self._append("vectors", vectors, start)
+            if scales is not None:
+                self._append("scales", scales, start)
+            replaced = self._live_rows([ids[i] for i in order])
+            self._deleted = np.concatenate([self._deleted, np.zeros(len(order), dtype=bool)])
+            try:
+                with self._conn:
+                    self._tombstone(replaced)
+                    self._conn.executemany(
+                        "INSERT INTO chunks (row, id, document, metadata, document_id) VALUES (?, ?, ?, ?, ?)",
+                        [(start + n, ids[i], documents[i] if documents else None,
+                          json.dumps(metadatas[i] if metadatas else {}),
+                          (metadatas[i] or {}).get("document_id") if metadatas else None)
+                         for n, i in enumerate(order)]
+                    )
+            except Exception:
+                self._refresh(force=True)
+                raise
+            self._count = start + len(order)
+            self._map()
+
+    add = upsert
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                rows = self._live_rows(ids)
+            elif where:
+                sql, params = where_clause(where)
+                rows = [row for (row,) in self._conn.execute(f"SELECT row FROM chunks WHERE deleted = 0 AND {sql}", params)]
+            else:
+                return
+            try:
+                with self._conn:
+                    self._tombstone(rows)
+            except Exception:
+                self._refresh(force=True)
+                raise
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas")):
+        """Returns live chunks in Chroma's result shape, ordered by insertion."""
+        sql = "SELECT row, id, document, metadata FROM chunks WHERE deleted = 0"
+        params = []
+        if where:
+            clause, where_params = where_clause(where)
+            sql += f" AND {clause}"
+            params += where_params
+        rows = []
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                for start in range(0, len(ids), 500):
+                    batch = list(ids[start:start + 500])
+                    rows += self._conn.execute(f"{sql} AND id IN ({','.join('?' * len(batch))})",
+                                               params + batch).fetchall()
+                rows.sort()
+                rows = rows[offset or 0:(offset or 0) + limit if limit is not None else None]
+            else:
+                if limit is not None or offset:
+                    sql += " ORDER BY row LIMIT ? OFFSET ?"
+                    params += [limit if limit is not None else -1, offset or 0]
+                else:
+                    sql += " ORDER BY row"
+                rows = self._conn.execute(sql, params).fetchall()
+            vectors, scales = self._vectors, self._scales
+        result = {
+            "ids": [chunk_id for _, chunk_id, _, _ in rows],
+            "documents": [document for _, _, document, _ in rows] if "documents" in include else None,
+            "metadatas": [json.loads(metadata or "{}") for _, _, _, metadata in rows] if "metadatas" in include else None,
+            "embeddings": None,
+        }
+        if "embeddings" in include:
+            positions = np.array([row for row, _, _, _ in rows], dtype=np.int64)
+            result["embeddings"] = self._decode(vectors, scales, positions).tolist() if rows else []
+        return result
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return self._count - self._tombstones
+
+    def persist(self):
+        """No-op: every write is durable once it returns."""
+
+    def search(self, embedding, k=4, where=None):
+        """Returns up to k (row, cosine similarity) pairs, best first."""
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            self._refresh()
+            vectors, scales, deleted, count = self._vectors, self._scales, self._deleted, self._count
+            candidates = None
+            if where:
+                clause, params = where_clause(where)
+                candidates = np.fromiter(
+                    (row for (row,) in self._conn.execute(f"SELECT row FROM chunks WHERE deleted = 0 AND {clause}", params)),
+                    dtype=np.int64)
+        if vectors is None or (candidates is not None and not candidates.size):
+            return []
+        if candidates is None:
+            scores = np.empty(count, dtype=np.float32)
+            for start in range(0, count, BLOCK_ROWS):
+                rows = slice(start, min(count, start + BLOCK_ROWS))
+                block = np.asarray(vectors[rows], dtype=np.float32)
+                scores[rows] = block @ query * (scales[rows] if scales is not None else 1.0)
+            scores[deleted] = -np.inf
+            rows = np.arange(count)
+        else:
+            rows = candidates
+            scores = np.concatenate([self._decode(vectors, scales, rows[i:i + BLOCK_ROWS]) @ query
+                                     for i in range(0, rows.size, BLOCK_ROWS)])
+        k = min(k, scores.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def similarity_search_by_vector_with_scores(self, embedding, k=4, filter=None):
+        # compact() renumbers rows, so the search and the row lookup must see the same generation
+        with self._lock:
+            hits = self.search(embedding, k=k, where=filter)
+            if not hits:
+                return []
+            found = {row: (document, metadata) for row, document, metadata in self._conn.execute(
+                f"SELECT row, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(hits))})",
+                [row for row, _ in hits])}
+        return [(Document(page_content=found[row][0] or "", metadata=json.loads(found[row][1] or "{}")), score)
+                for row, score in hits if row in found]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_scores(embedding, k=k, filter=filter)]
+
+    def compact(self):
+        """Rewrites the files without tombstoned rows. Returns the number of rows dropped."""
+        with self._lock:
+            self._refresh()
+            live = np.array([row for (row,) in self._conn.execute("SELECT row FROM chunks WHERE deleted = 0 ORDER BY row")],
+                            dtype=np.int64)
+            dropped = self._count - live.size
+            if not dropped:
+                return 0
+            old_generation = self.generation
+            new_generation = old_generation + 1
+            for stale in glob.glob(os.path.join(self.directory, f"*.{new_generation}.bin")):
+                os.remove(stale)
+            names = [("vectors", self._vectors)] + ([("scales", self._scales)] if self._scales is not None else [])
+            for name, source in names:
+                with open(self._path(name, new_generation), "wb") as f:
+                    for start in range(0, live.size, BLOCK_ROWS):
+                        f.write(np.ascontiguousarray(source[live[start:start + BLOCK_ROWS]]).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            # Rows only ever move down, so renumbering in ascending order never collides
+            with self._conn:
+                self._conn.execute("DELETE FROM chunks WHERE deleted = 1")
+                self._conn.executemany("UPDATE chunks SET row = ? WHERE row = ?",
+                                       [(new, int(old)) for new, old in enumerate(live) if new != old])
+                self._conn.execute("UPDATE info SET value = ? WHERE key = 'generation'", (str(new_generation),))
+            self._vectors = self._scales = None
+            for name, _ in names:
+                os.remove(self._path(name, old_generation))
+            self._refresh(force=True)
+            return dropped
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            size = sum(os.path.getsize(path) for path in glob.glob(os.path.join(self.directory, f"*.{self.generation}.bin")))
+            return {"rows": self._count, "live": self._count - self._tombstones,
+                    "tombstones": self._tombstones, "dim": self.dim, "dtype": self.dtype, "bytes": size}
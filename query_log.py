@@ -0,0 +1,174 @@
+import argparse
+import csv
+import datetime
+import io
+import json
+import sys
+
+from sqlalchemy import and_, exists, insert, or_
+
+from database import init_db, filter_query_logs, query_refs, AuditLog, Document, QueryLog, QueryRef, User
+
+EXPORT_FIELDS = ["id", "timestamp", "username", "prompt", "response", "refs"]
+
+
+def iter_query_logs(session, batch_size=1000, **filters):
+    """Yields export rows oldest first, fetching one keyset batch at a time so memory stays constant."""
+    cursor = None
+    while True:
+        query = filter_query_logs(
+            session.query(QueryLog, User.username).join(User, QueryLog.user_id == User.id), **filters)
+        if cursor is not None:
+            timestamp, log_id = cursor
+            query = query.filter(or_(
+                QueryLog.timestamp > timestamp,
+                and_(QueryLog.timestamp == timestamp, QueryLog.id > log_id)
+            ))
+        rows = query.order_by(QueryLog.timestamp, QueryLog.id).limit(batch_size).all()
+        if not rows:
+            return
+        refs = query_refs(session, [log.id for log, _ in rows])
+        for log, username in rows:
+            yield {
+                "id": log.id,
+                "timestamp": log.timestamp.isoformat(),
+                "username": username,
+                "prompt": log.prompt,
+                "response": log.response,
+                "refs": sorted(refs.get(log.id, [])),
+            }
+        last = rows[-1][0]
+        cursor = (last.timestamp, last.id)
+        # Drop the batch's ORM objects so the identity map does not grow with the export
+        for log, _ in rows:
+            session.expunge(log)
+
+
+def export_lines(rows, fmt="jsonl"):
+    """Encodes export rows as CSV or JSON Lines, one string per row (CSV starts with its header)."""
+    if fmt == "jsonl":
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(dict(row, refs=";".join(row["refs"])))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def backfill(session, batch_size=1000, clear_details=False):
+    """Creates query_logs rows from QUERY audit events whose details hold the legacy JSON blob.
+
+    Safe to re-run: events that already have a query log are skipped. With
+    ``clear_details`` the migrated JSON is removed from audit_logs.details.
+    Returns (migrated, unparseable) counts.
+    """
+    migrated = unparseable = 0
+    last_id = 0
+    document_ids = {}
+    while True:
+        events = session.query(AuditLog)\
+            .filter(AuditLog.action == 'QUERY', AuditLog.id > last_id, AuditLog.details.isnot(None),
+                    ~exists().where(QueryLog.audit_log_id == AuditLog.id))\
+            .order_by(AuditLog.id).limit(batch_size).all()
+        if not events:
+            break
+        last_id = events[-1].id
+        logs = []
+        for event in events:
+            try:
+                details = json.loads(event.details)
+            except (TypeError, ValueError):
+                unparseable += 1
+                continue
+            if not isinstance(details, dict):
+                unparseable += 1
+                continue
+            log = QueryLog(audit_log_id=event.id, user_id=event.user_id, timestamp=event.timestamp,
+                           prompt=details.get("prompt"), response=details.get("response"))
+            logs.append((log, event, [r for r in details.get("refs") or [] if isinstance(r, str)]))
+        session.add_all([log for log, _, _ in logs])
+        session.flush()
+
+        refs = []
+        for log, event, sources in logs:
+            for source in set(sources):
+                key = (event.user_id, source)
+                if key not in document_ids:
+                    document_ids[key] = session.query(Document.id)\
+                        .filter_by(owner_id=event.user_id, filename=source).order_by(Document.id.desc()).limit(1).scalar()
+                refs.append({"query_log_id": log.id, "source": source, "document_id": document_ids[key]})
+            if clear_details:
+                event.details = None
+        if refs:
+            session.execute(insert(QueryRef), refs)
+        session.commit()
+        for event in events:
+            session.expunge(event)
+        for log, _, _ in logs:
+            session.expunge(log)
+        migrated += len(logs)
+    return migrated, unparseable
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or backfill the structured query log.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="Stream query logs as CSV or JSON Lines")
+    export.add_argument("--format", choices=["csv", "jsonl"], default="jsonl")
+    export.add_argument("--output", help="File to write (default: stdout)")
+    export.add_argument("--user", help="Only queries by this username")
+    export.add_argument("--since", type=_parse_date, help="YYYY-MM-DD, inclusive")
+    export.add_argument("--until", type=_parse_date, help="YYYY-MM-DD, inclusive")
+    export.add_argument("--source", help="Only queries citing this document filename")
+    export.add_argument("--document-id", type=int, help="Only queries citing this document")
+
+    migrate = subparsers.add_parser("backfill", help="Create query logs from legacy QUERY audit details")
+    migrate.add_argument("--batch-size", type=int, default=1000)
+    migrate.add_argument("--clear-details", action="store_true",
+                         help="Remove the migrated JSON from audit_logs.details")
+    args = parser.parse_args(argv)
+
+    session = init_db()()
+    try:
+        if args.command == "backfill":
+            migrated, unparseable = backfill(session, args.batch_size, args.clear_details)
+            print(f"Backfilled {migrated} query logs ({unparseable} unparseable audit entries skipped).")
+            return 0
+
+        user_id = None
+        if args.user:
+            user = session.query(User).filter_by(username=args.user).first()
+            if user is None:
+                print(f"Unknown user {args.user}", file=sys.stderr)
+                return 1
+            user_id = user.id
+        rows = iter_query_logs(
+            session, user_id=user_id, start=args.since, source=args.source, document_id=args.document_id,
+            end=args.until + datetime.timedelta(days=1) if args.until else None,
+        )
+        out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+        try:
+            for line in export_lines(rows, args.format):
+                out.write(line)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        return 0
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,11 @@
+import hashlib
 import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from langchain_community.llms import Ollama
-from langchain_community.embeddings import OllamaEmbeddings
 from langchain_community.vectorstores import Chroma
 try:
     from langchain.text_splitter import RecursiveCharacterTextSplitter
@@ -8,45 +13,482 @@ except ImportError:
     from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 try:
-    from langchain.chains import RetrievalQA
+    from langchain.prompts import PromptTemplate
 except ImportError:
-    try:
-        from langchain.chains.retrieval_qa.base import RetrievalQA
-    except ImportError:
-        # Fallback or error handling if RetrievalQA is moved elsewhere
-        pass 
+    from langchain_core.prompts import PromptTemplate
 
 try:
-    from langchain.prompts import PromptTemplate
+    from langchain_core.documents import Document
 except ImportError:
-    from langchain_core.prompts import PromptTemplate
+    from langchain.schema import Document
+
+from bm25_index import BM25Index
+from cache import LRUCache
+from context_packing import ContextPacker
+from contract_analyzer import ContractAnalyzer
+from embedding_backends import create_embeddings, resolve_embedding_config
+from embedding_cache import CachedEmbeddings
+from mmap_vector_store import MmapVectorStore
+from scheduler import ConcurrencyLimiter, Coalescer, MicroBatcher
+from streaming_splitter import StreamingSplitter, batched
+from tracing import timed_iter, tracer
+
+# Approximate estimate_tokens() size of one 1000-character chunk of legal text
+TOKENS_PER_CHUNK = 200
+
+QA_PROMPT = PromptTemplate(
+    input_variables=["context", "question"],
+    template=(
+        "Use the following pieces of context to answer the question at the end. "
+        "If you don't know the answer, just say that you don't know, don't try to make up an answer.\n\n"
+        "{context}\n\nQuestion: {question}\nHelpful Answer:"
+    )
+)
+
+def normalize_question(question):
+    """Normalizes a question for use as a cache key."""
+    return re.sub(r"\s+", " ", question).strip().lower().rstrip("?.! ")
+
+def chunk_key(doc):
+    """Stable identity of a retrieved chunk, used in answer cache keys."""
+    return hashlib.sha256(f"{doc.metadata.get('source', '')}\0{doc.page_content}".encode("utf-8")).hexdigest()
+
+def chunk_id(metadata, position):
+    """Stable vector ID for a chunk: derived from its document and position when the document is known."""
+    document_id = metadata.get("document_id")
+    if document_id is None:
+        return str(uuid.uuid4())
+    return f"doc-{document_id}-{position}"
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def reciprocal_rank_fusion(result_lists, k=60):
+    """Merges ranked document lists, scoring each document by sum(1 / (k + rank))."""
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = chunk_key(doc)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+def partition_name(owner):
+    """Chroma collection name holding one owner's chunks (the legacy shared collection for None)."""
+    if owner is None:
+        return "langchain"
+    slug = re.sub(r"[^a-zA-Z0-9_-]", "_", owner)[:40]
+    return f"owner_{slug}_{hashlib.sha1(owner.encode('utf-8')).hexdigest()[:8]}"
+
+class Partition:
+    """A per-owner vector collection and its BM25 index."""
+
+    def __init__(self, owner, vector_store, lexical_index):
+        self.owner = owner
+        self.vector_store = vector_store
+        self.lexical_index = lexical_index
 
 class RAGEngine:
-    def __init__(self, model_name="llama3", persist_directory="./chroma_db"):
-        self.llm = Ollama(model=model_name)
-        self.embeddings = OllamaEmbeddings(model=model_name)
+    def __init__(self, model_name="llama3", persist_directory="./chroma_db", cache_size=1024, cache_ttl=3600, top_k=4,
+                 llm_concurrency=2, embed_concurrency=4, base_url=None, embedding_backend=None, embedding_model=None,
+                 vector_backend=None, vector_dtype="float16", context_tokens=None, mmr_lambda=0.7, fetch_k=20):
+        base_url = base_url or os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+        if "://" not in base_url:
+            base_url = f"http://{base_url}"
+        self.llm = Ollama(model=model_name, base_url=base_url)
         self.persist_directory = persist_directory
-        self.vector_store = Chroma(persist_directory=persist_directory, embedding_function=self.embeddings)
+        os.makedirs(persist_directory, exist_ok=True)
+        # Embeddings come from a separate, much smaller model than generation unless
+        # the store was built with Ollama embeddings before the backend was configurable
+        self.embedding_backend, self.embedding_model = resolve_embedding_config(
+            persist_directory, embedding_backend, embedding_model, legacy_model=model_name
+        )
+        self.embeddings = CachedEmbeddings(
+            create_embeddings(self.embedding_backend, self.embedding_model, base_url),
+            self.embedding_model,
+            os.path.join(persist_directory, "embedding_cache.sqlite")
+        )
         self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        self.page_splitter = StreamingSplitter(chunk_size=1000, chunk_overlap=200)
+        self.top_k = top_k
+        # Candidates fetched per retriever; MMR and the token budget pick the context from them
+        self.fetch_k = max(fetch_k, top_k)
+        # "chroma", or "mmap" for the memory-mapped quantized store
+        self.vector_backend = vector_backend or os.environ.get("RAG_VECTOR_BACKEND", "chroma")
+        self.vector_dtype = vector_dtype
+        self.retrieval_cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        self.answer_cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        # Per owner, so one owner's uploads do not invalidate everyone else's cached answers
+        self._corpus_versions = {}
+        self._version_lock = threading.Lock()
+        self._partitions = {}
+        # Guards _partition_locks only; each owner's partition is opened under its own
+        # lock so loading one large index does not stall queries for other owners
+        self._partitions_lock = threading.Lock()
+        self._partition_locks = {}
+        self.qa_chain = QA_PROMPT | self.llm
+        # The budget defaults to what stuffing top_k chunks used to cost, so packing never
+        # makes prompts longer; the larger candidate pool only improves what fills it
+        self.context_packer = ContextPacker(
+            max_tokens=context_tokens or TOKENS_PER_CHUNK * top_k, mmr_lambda=mmr_lambda, baseline_chunks=top_k
+        )
+        self.llm_limiter = ConcurrencyLimiter("llm", llm_concurrency)
+        self.embed_limiter = ConcurrencyLimiter("embed", embed_concurrency)
+        self.generations = Coalescer()
+        self.query_embedder = MicroBatcher(self._embed_queries)
+        self.contract_analyzer = ContractAnalyzer(
+            self.llm, self.llm_limiter, model_name, os.path.join(persist_directory, "clause_cache.sqlite")
+        )
 
-    def ingest_document(self, text, metadata):
+    def partition(self, owner):
+        """Returns the vector collection and lexical index for an owner, opening them on first use."""
+        partition = self._partitions.get(owner)
+        if partition is not None:
+            return partition
+        with self._partitions_lock:
+            lock = self._partition_locks.setdefault(owner, threading.Lock())
+        with lock:
+            partition = self._partitions.get(owner)
+            if partition is None:
+                name = partition_name(owner)
+                if self.vector_backend == "mmap":
+                    vector_store = MmapVectorStore(os.path.join(self.persist_directory, "mmap", name), self.vector_dtype)
+                else:
+                    vector_store = Chroma(
+                        collection_name=name,
+                        persist_directory=self.persist_directory,
+                        embedding_function=self.embeddings
+                    )
+                lexical_path = os.path.join(self.persist_directory, "bm25.pkl" if owner is None else f"bm25_{name}.pkl")
+                partition = self._partitions[owner] = Partition(owner, vector_store, BM25Index(lexical_path))
+            return partition
+
+    def warm_up_embeddings(self):
+        """Loads the embedding model, bypassing the cache so the backend is actually exercised."""
+        with self.embed_limiter.slot():
+            self.embeddings.embeddings.embed_query("warm up")
+
+    def warm_up_llm(self):
+        """Has Ollama load the generation model by producing a single token."""
+        with self.llm_limiter.slot():
+            self.llm.invoke("Hello", num_predict=1)
+
+    def corpus_version(self, owner):
+        with self._version_lock:
+            return self._corpus_versions.get(owner, 0)
+
+    def bump_corpus_version(self, owner):
+        """Invalidates an owner's cached retrievals and answers after their partition changes."""
+        with self._version_lock:
+            self._corpus_versions[owner] = self._corpus_versions.get(owner, 0) + 1
+
+    def cache_stats(self):
+        return {
+            "corpus_changes": sum(self._corpus_versions.values()),
+            "retrieval": self.retrieval_cache.stats(),
+            "answer": self.answer_cache.stats(),
+            "embedding": self.embeddings.stats(),
+            "clause_analysis": self.contract_analyzer.cache.stats(),
+        }
+
+    def scheduler_stats(self):
+        """Queue depth and wait times of the shared LLM and embedding backends."""
+        return {
+            "llm": self.llm_limiter.stats(),
+            "embed": self.embed_limiter.stats(),
+            "generations": self.generations.stats(),
+            "query_embedding_batches": self.query_embedder.stats(),
+        }
+
+    def _embed_documents(self, texts, parent=None):
+        with tracer.span("ingest.embed", parent=parent, chunks=len(texts)):
+            with self.embed_limiter.slot():
+                return self.embeddings.embed_documents(texts)
+
+    def _embed_queries(self, texts):
+        with self.embed_limiter.slot():
+            return self.embeddings.embed_queries(texts)
+
+    def _split(self, text, metadata):
+        """Splits text into chunks carrying their stable ID, position and content hash."""
         chunks = self.text_splitter.create_documents([text], metadatas=[metadata])
-        self.vector_store.add_documents(chunks)
-        self.vector_store.persist()
-
-    def query(self, question):
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=self.vector_store.as_retriever(),
-            return_source_documents=True
-        )
-        return qa_chain({"query": question})
+        for position, chunk in enumerate(chunks):
+            chunk.metadata = dict(chunk.metadata, chunk_index=position, content_hash=content_hash(chunk.page_content))
+            chunk.metadata["chunk_id"] = chunk_id(chunk.metadata, position)
+        return chunks
+
+    def _document_chunks(self, partition, document_id):
+        """Maps chunk ID to content hash for every stored chunk of a document."""
+        found = partition.vector_store._collection.get(where={"document_id": document_id}, include=["metadatas"])
+        return {chunk_id: (metadata or {}).get("content_hash") for chunk_id, metadata in zip(found["ids"], found["metadatas"])}
+
+    def ingest_document(self, text, metadata):
+        """Indexes a document. Re-ingesting a known document_id only re-embeds chunks whose text changed."""
+        with tracer.span("ingest.split") as attrs:
+            chunks = self._split(text, metadata)
+            attrs["chunks"] = len(chunks)
+        partition = self.partition(metadata.get("owner"))
+        existing = {}
+        if metadata.get("document_id") is not None:
+            existing = self._document_chunks(partition, metadata["document_id"])
+        changed = [c for c in chunks if existing.get(c.metadata["chunk_id"]) != c.metadata["content_hash"]]
+        texts = [c.page_content for c in changed]
+        self._write_batch(partition, {
+            "ids": [c.metadata["chunk_id"] for c in changed],
+            "texts": texts,
+            "embeddings": self._embed_documents(texts) if texts else [],
+            "metadatas": [c.metadata for c in changed],
+        })
+        stale = sorted(set(existing) - {c.metadata["chunk_id"] for c in chunks})
+        self._delete_chunks(partition, stale)
+        partition.lexical_index.checkpoint()
+        self.bump_corpus_version(metadata.get("owner"))
+        return {"chunks": len(chunks), "embedded": len(changed), "deleted": len(stale)}
+
+    def ingest_pages(self, pages, metadata, batch_size=64):
+        """Indexes a document from an iterable of (page_number, text) pairs with memory bounded by batch_size.
+
+        Chunks carry ``page``/``page_end`` metadata and are embedded and written
+        ``batch_size`` at a time as pages are read. Unchanged chunks of a known
+        document_id are skipped and chunks past the new end are deleted. Embedding
+        and writes are traced per batch; splitting, which is interleaved with
+        reading pages, is recorded as one ``ingest.split`` span for the document.
+        """
+        partition = self.partition(metadata.get("owner"))
+        existing = {}
+        if metadata.get("document_id") is not None:
+            existing = self._document_chunks(partition, metadata["document_id"])
+        stats = {"chunks": 0, "embedded": 0, "deleted": 0}
+        seen = set()
+        timings = {}
+        pages = timed_iter(pages, timings, "read")
+        chunks = timed_iter(self.page_splitter.split_pages(pages, metadata), timings, "split")
+        for batch in batched(chunks, batch_size):
+            changed = []
+            for chunk in batch:
+                position = stats["chunks"]
+                stats["chunks"] += 1
+                chunk.metadata.update(chunk_index=position, content_hash=content_hash(chunk.page_content))
+                chunk.metadata["chunk_id"] = chunk_id(chunk.metadata, position)
+                seen.add(chunk.metadata["chunk_id"])
+                if existing.get(chunk.metadata["chunk_id"]) != chunk.metadata["content_hash"]:
+                    changed.append(chunk)
+            texts = [c.page_content for c in changed]
+            stats["embedded"] += self._write_batch(partition, {
+                "ids": [c.metadata["chunk_id"] for c in changed],
+                "texts": texts,
+                "embeddings": self._embed_documents(texts) if texts else [],
+                "metadatas": [c.metadata for c in changed],
+            })
+        stale = sorted(set(existing) - seen)
+        self._delete_chunks(partition, stale)
+        stats["deleted"] = len(stale)
+        # Pulling chunks also pulls pages, so reading time is taken out of the split time
+        tracer.record_span("ingest.split", timings.get("split", 0.0) - timings.get("read", 0.0), chunks=stats["chunks"])
+        partition.lexical_index.checkpoint()
+        self.bump_corpus_version(metadata.get("owner"))
+        return stats
+
+    def _untracked_chunks(self, partition, source):
+        """IDs of a file's chunks indexed before chunks carried a document_id."""
+        found = partition.vector_store._collection.get(where={"source": source}, include=["metadatas"])
+        return [chunk_id for chunk_id, metadata in zip(found["ids"], found["metadatas"])
+                if (metadata or {}).get("document_id") is None]
+
+    def delete_document(self, document_id, owner=None, source=None):
+        """Removes every vector and lexical entry of a document. Returns the number of chunks removed.
+
+        Passing the document's filename as ``source`` also removes its chunks from
+        before stable chunk IDs, which can only be matched by filename.
+        """
+        partition = self.partition(owner)
+        ids = set(self._document_chunks(partition, document_id))
+        if source is not None:
+            ids.update(self._untracked_chunks(partition, source))
+        ids = sorted(ids)
+        self._delete_chunks(partition, ids)
+        partition.lexical_index.checkpoint()
+        self.bump_corpus_version(owner)
+        return len(ids)
+
+    def _delete_chunks(self, partition, ids):
+        if not ids:
+            return
+        with tracer.span("index.delete", chunks=len(ids)):
+            for start in range(0, len(ids), 1000):
+                partition.vector_store._collection.delete(ids=ids[start:start + 1000])
+            partition.vector_store.persist()
+            partition.lexical_index.delete(ids)
+
+    def compact(self, owner=None):
+        """Drops deleted entries from the owner's lexical index and, for the mmap backend, its vectors."""
+        partition = self.partition(owner)
+        with tracer.span("index.compact"):
+            partition.lexical_index.compact()
+            if isinstance(partition.vector_store, MmapVectorStore):
+                partition.vector_store.compact()
+
+    def ingest_many(self, items, embed_batch_size=64, write_batch_size=1024, max_concurrency=4):
+        """Ingests an iterable of (text, metadata) pairs in batches.
+
+        Chunks are embedded in batches of ``embed_batch_size`` with at most
+        ``max_concurrency`` embedding requests in flight, written to Chroma in
+        batches of ``write_batch_size``. Each write batch is appended to the
+        lexical index log; the index is checkpointed once per owner at the end.
+        Chunks are routed to the partition of their ``owner`` metadata.
+        Returns throughput stats.
+        """
+        start = time.perf_counter()
+        with tracer.span("ingest.many") as attrs:
+            trace = tracer.current()
+            stats = {"docs": 0, "chunks": 0}
+            pending = []
+            in_flight = []
+            buffers = {}
+
+            def embed(batch):
+                texts = [c.page_content for c in batch]
+                return batch, self._embed_documents(texts, parent=trace)
+
+            def drain(block):
+                while in_flight and (block or in_flight[0].done()):
+                    batch, vectors = in_flight.pop(0).result()
+                    for chunk, vector in zip(batch, vectors):
+                        owner = chunk.metadata.get("owner")
+                        buffer = buffers.setdefault(owner, {"ids": [], "texts": [], "embeddings": [], "metadatas": []})
+                        buffer["ids"].append(chunk.metadata["chunk_id"])
+                        buffer["texts"].append(chunk.page_content)
+                        buffer["embeddings"].append(vector)
+                        buffer["metadatas"].append(chunk.metadata)
+                        if len(buffer["ids"]) >= write_batch_size:
+                            stats["chunks"] += self._write_batch(self.partition(owner), buffer)
+
+            with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                for text, metadata in items:
+                    with tracer.span("ingest.split"):
+                        pending.extend(self._split(text, metadata))
+                    stats["docs"] += 1
+                    while len(pending) >= embed_batch_size:
+                        if len(in_flight) >= max_concurrency:
+                            in_flight[0].result()
+                        drain(block=False)
+                        in_flight.append(executor.submit(embed, pending[:embed_batch_size]))
+                        pending = pending[embed_batch_size:]
+                if pending:
+                    in_flight.append(executor.submit(embed, pending))
+                drain(block=True)
+            for owner, buffer in buffers.items():
+                stats["chunks"] += self._write_batch(self.partition(owner), buffer)
+                self.partition(owner).lexical_index.checkpoint()
+                self.bump_corpus_version(owner)
+            attrs.update(docs=stats["docs"], chunks=stats["chunks"])
+
+        elapsed = time.perf_counter() - start
+        stats["seconds"] = elapsed
+        stats["docs_per_sec"] = stats["docs"] / elapsed if elapsed else 0.0
+        stats["chunks_per_sec"] = stats["chunks"] / elapsed if elapsed else 0.0
+        return stats
+
+    def _write_batch(self, partition, buffer):
+        """Writes pre-embedded chunks to a partition and appends them to its lexical index log."""
+        count = len(buffer["ids"])
+        if not count:
+            return 0
+        with tracer.span("ingest.persist", chunks=count):
+            partition.vector_store._collection.upsert(
+                ids=buffer["ids"],
+                documents=buffer["texts"],
+                embeddings=buffer["embeddings"],
+                metadatas=buffer["metadatas"],
+            )
+            partition.vector_store.persist()
+            partition.lexical_index.add(buffer["ids"], buffer["texts"])
+        for values in buffer.values():
+            values.clear()
+        return count
+
+    def retrieve(self, question, owner=None):
+        """Returns the passages chosen as context for a question from the owner's partition."""
+        return self._retrieve_context(question, owner).passages
+
+    def _retrieve_context(self, question, owner):
+        """Fetches ``fetch_k`` candidates per retriever, fuses them and packs the context, cached per owner version."""
+        key = (owner, normalize_question(question), self.corpus_version(owner))
+        with tracer.span("query.retrieve") as attrs:
+            packed = self.retrieval_cache.get(key)
+            attrs["cache_hit"] = packed is not None
+            if packed is None:
+                partition = self.partition(owner)
+                with tracer.span("query.embed"):
+                    # Concurrent questions are embedded together in one micro-batch
+                    query_vector = self.query_embedder.submit(question)
+                with tracer.span("query.vector_search"):
+                    vector_hits = partition.vector_store.similarity_search_by_vector(query_vector, k=self.fetch_k)
+                with tracer.span("query.lexical_search"):
+                    lexical_hits = self._lexical_search(partition, question)
+                candidates = reciprocal_rank_fusion([vector_hits, lexical_hits])[:self.fetch_k]
+                with tracer.span("query.pack", candidates=len(candidates)):
+                    packed = self.context_packer.pack(candidates)
+                self.retrieval_cache.set(key, packed)
+        return packed
+
+    def _lexical_search(self, partition, question):
+        hits = partition.lexical_index.search(question, k=self.fetch_k)
+        if not hits:
+            return []
+        ids = [chunk_id for chunk_id, _ in hits]
+        found = partition.vector_store.get(ids=ids)
+        by_id = {
+            chunk_id: Document(page_content=text, metadata=metadata or {})
+            for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+        }
+        return [by_id[chunk_id] for chunk_id in ids if chunk_id in by_id]
+
+    def _answer_key(self, question, owner, source_documents):
+        return (owner, normalize_question(question), self.corpus_version(owner), tuple(chunk_key(d) for d in source_documents))
+
+    def _generate(self, question, owner, packed):
+        """Returns a token stream for the answer, shared with identical in-flight requests."""
+        key = self._answer_key(question, owner, packed.passages)
+        trace = tracer.current()
+
+        def produce(stream):
+            # Only the request that starts a generation counts its prompt
+            with tracer.span("query.prompt", parent=trace) as attrs:
+                self.context_packer.record(packed)
+                attrs.update(prompt_tokens=packed.tokens, saved_tokens=packed.saved_tokens, passages=len(packed.passages))
+            inputs = {"context": packed.text, "question": question}
+            parts = []
+            with tracer.span("query.generate", parent=trace) as attrs:
+                with self.llm_limiter.slot():
+                    start = time.perf_counter()
+                    for token in self.qa_chain.stream(inputs):
+                        if not parts:
+                            attrs["time_to_first_token"] = time.perf_counter() - start
+                        parts.append(token)
+                        stream.push(token)
+                attrs["tokens"] = len(parts)
+            self.answer_cache.set(key, "".join(parts))
+
+        return self.generations.stream(key, produce)
+
+    def query(self, question, owner=None):
+        with tracer.span("query"):
+            packed = self._retrieve_context(question, owner)
+            answer = self.answer_cache.get(self._answer_key(question, owner, packed.passages))
+            if answer is None:
+                answer = self._generate(question, owner, packed).text()
+        return {"query": question, "result": answer, "source_documents": packed.passages}
+
+    def stream_query(self, question, owner=None):
+        """Retrieves sources up front and returns them with an iterator of answer tokens."""
+        packed = self._retrieve_context(question, owner)
+        cached = self.answer_cache.get(self._answer_key(question, owner, packed.passages))
+        if cached is not None:
+            return packed.passages, iter([cached])
+        return packed.passages, iter(self._generate(question, owner, packed))
 
     def analyze_contract(self, contract_text):
-        prompt = PromptTemplate(
-            input_variables=["text"],
-            template="Analyze the following contract clause and identify potential risks:\n\n{text}"
-        )
-        chain = prompt | self.llm
-        return chain.invoke({"text": contract_text})
+        """Analyzes a contract clause by clause and returns the risks ranked by severity."""
+        return self.contract_analyzer.analyze(contract_text)
@@ -0,0 +1,171 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import time
+
+from embedding_backends import DEFAULT_MODELS, create_embeddings, read_marker, write_marker
+from embedding_cache import CachedEmbeddings
+from mmap_vector_store import MmapVectorStore
+
+# Appended to a collection name while its re-embedded copy is being built (owner
+# partition names are at most 55 characters, Chroma allows 63)
+STAGING_SUFFIX = "_reembed"
+# The original collection is renamed to this until the whole run has succeeded
+OLD_SUFFIX = "_old"
+# Records the target model of a run in progress, so an interrupted run can be undone
+JOURNAL_FILE = "reembed.json"
+
+
+def collection_names(client):
+    # chromadb < 0.6 returns Collection objects, later versions return names
+    return sorted(getattr(c, "name", c) for c in client.list_collections())
+
+
+def reembed_collection(client, name, embeddings, page_size=256):
+    """Rebuilds one collection with new embeddings and swaps it in, keeping the original
+    aside as ``name + OLD_SUFFIX`` until ``recover`` finishes the run. Returns the chunk count."""
+    source = client.get_collection(name)
+    staging_name = name + STAGING_SUFFIX
+    if staging_name in collection_names(client):
+        client.delete_collection(staging_name)
+    staging = client.create_collection(staging_name, metadata=source.metadata)
+    offset = 0
+    while True:
+        page = source.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        offset += len(page["ids"])
+        staging.add(
+            ids=page["ids"],
+            documents=page["documents"],
+            metadatas=page["metadatas"],
+            embeddings=embeddings.embed_documents(page["documents"]),
+        )
+    if staging.count() != source.count():
+        raise RuntimeError(f"{name}: copied {staging.count()} of {source.count()} chunks, keeping the original")
+    source.modify(name=name + OLD_SUFFIX)
+    staging.modify(name=name)
+    return offset
+
+
+def reembed_mmap_store(directory, embeddings, page_size=256):
+    """Rebuilds one memory-mapped store with new embeddings and swaps the directory in,
+    keeping the original aside as ``directory + OLD_SUFFIX`` until ``recover`` finishes the run."""
+    source = MmapVectorStore(directory)
+    staging_dir = directory + STAGING_SUFFIX
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    staging = MmapVectorStore(staging_dir, source.dtype)
+    offset = 0
+    while True:
+        page = source.get(limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        offset += len(page["ids"])
+        staging.upsert(ids=page["ids"], documents=page["documents"], metadatas=page["metadatas"],
+                       embeddings=embeddings.embed_documents(page["documents"]))
+    os.rename(directory, directory + OLD_SUFFIX)
+    os.rename(staging_dir, directory)
+    return offset
+
+
+def recover(persist_directory, client=None):
+    """Finishes or undoes a re-embed run that stopped before cleaning up.
+
+    If the run got as far as switching the embedding marker, the set-aside
+    originals are deleted; otherwise every original is restored, so the store
+    matches the marker again. Leftover staging copies are always removed.
+    Returns "completed", "rolled back" or None when there was nothing to do.
+    """
+    journal = os.path.join(persist_directory, JOURNAL_FILE)
+    if not os.path.exists(journal):
+        return None
+    with open(journal) as f:
+        target = json.load(f)
+    completed = read_marker(persist_directory) == target
+
+    if client is None:
+        import chromadb
+        client = chromadb.PersistentClient(path=persist_directory)
+    names = collection_names(client)
+    for name in names:
+        if name.endswith(STAGING_SUFFIX):
+            client.delete_collection(name)
+    for name in names:
+        if not name.endswith(OLD_SUFFIX):
+            continue
+        if not completed:
+            original = name[:-len(OLD_SUFFIX)]
+            if original in names:
+                client.delete_collection(original)
+            client.get_collection(name).modify(name=original)
+        else:
+            client.delete_collection(name)
+
+    for staging_dir in glob.glob(os.path.join(persist_directory, "mmap", "*" + STAGING_SUFFIX)):
+        shutil.rmtree(staging_dir)
+    for old_dir in glob.glob(os.path.join(persist_directory, "mmap", "*" + OLD_SUFFIX)):
+        if not completed:
+            original = old_dir[:-len(OLD_SUFFIX)]
+            shutil.rmtree(original, ignore_errors=True)
+            os.rename(old_dir, original)
+        else:
+            shutil.rmtree(old_dir)
+    os.remove(journal)
+    return "completed" if completed else "rolled back"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Re-embed every vector collection with a new embedding model. Stop the app first.")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--backend", choices=sorted(DEFAULT_MODELS), default="sentence-transformers")
+    parser.add_argument("--model", help="Embedding model (defaults to the backend's default)")
+    parser.add_argument("--base-url", default=os.environ.get("OLLAMA_HOST", "http://localhost:11434"))
+    parser.add_argument("--page-size", type=int, default=256)
+    args = parser.parse_args(argv)
+
+    import chromadb
+    model = args.model or DEFAULT_MODELS[args.backend]
+    client = chromadb.PersistentClient(path=args.persist_directory)
+    outcome = recover(args.persist_directory, client)
+    if outcome:
+        print(f"Found an interrupted re-embed run: {outcome}.")
+    current = read_marker(args.persist_directory)
+    if current == {"backend": args.backend, "model": model}:
+        print(f"{args.persist_directory} is already embedded with {args.backend}:{model}.")
+        return 0
+
+    embeddings = CachedEmbeddings(
+        create_embeddings(args.backend, model, args.base_url),
+        model,
+        os.path.join(args.persist_directory, "embedding_cache.sqlite")
+    )
+    names = collection_names(client)
+    mmap_dirs = sorted(d for d in glob.glob(os.path.join(args.persist_directory, "mmap", "*")) if os.path.isdir(d))
+    with open(os.path.join(args.persist_directory, JOURNAL_FILE), "w") as f:
+        json.dump({"backend": args.backend, "model": model}, f)
+    total = 0
+    start = time.perf_counter()
+    for name in names:
+        count = reembed_collection(client, name, embeddings, page_size=args.page_size)
+        total += count
+        print(f"{name}: {count} chunks")
+    for directory in mmap_dirs:
+        count = reembed_mmap_store(directory, embeddings, page_size=args.page_size)
+        total += count
+        print(f"mmap/{os.path.basename(directory)}: {count} chunks")
+    # The marker is only switched once every collection is in the new vector space;
+    # until then an interrupted run is rolled back to the originals
+    write_marker(args.persist_directory, args.backend, model)
+    recover(args.persist_directory, client)
+    elapsed = time.perf_counter() - start
+    print(f"Re-embedded {total} chunks in {len(names) + len(mmap_dirs)} collections with {args.backend}:{model} "
+          f"in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} chunks/s).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
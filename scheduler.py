@@ -0,0 +1,180 @@
+import threading
+import time
+import queue
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+
+class ConcurrencyLimiter:
+    """Caps concurrent calls to a backend and records queue depth and wait times."""
+
+    def __init__(self, name, max_concurrency):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.waiting = 0
+        self.in_flight = 0
+        self.total = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self):
+        start = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+        self._semaphore.acquire()
+        wait = time.perf_counter() - start
+        with self._lock:
+            self.waiting -= 1
+            self.in_flight += 1
+            self.total += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "queue_depth": self.waiting,
+                "in_flight": self.in_flight,
+                "calls": self.total,
+                "avg_wait_s": self.total_wait / self.total if self.total else 0.0,
+                "max_wait_s": self.max_wait,
+            }
+
+
+class TokenStream:
+    """Tokens of one generation, replayable by any number of concurrent readers."""
+
+    def __init__(self):
+        self._tokens = []
+        self._done = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    def push(self, token):
+        with self._cond:
+            self._tokens.append(token)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._cond.notify_all()
+
+    def __iter__(self):
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self._tokens) and not self._done:
+                    self._cond.wait()
+                if index < len(self._tokens):
+                    token = self._tokens[index]
+                elif self._error is not None:
+                    raise self._error
+                else:
+                    return
+            index += 1
+            yield token
+
+    def text(self):
+        return "".join(self)
+
+
+class Coalescer:
+    """Runs one producer per key; identical requests that arrive while it runs share its stream."""
+
+    def __init__(self):
+        self.started = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def stream(self, key, producer):
+        with self._lock:
+            stream = self._in_flight.get(key)
+            if stream is not None:
+                self.coalesced += 1
+                return stream
+            stream = self._in_flight[key] = TokenStream()
+            self.started += 1
+
+        def run():
+            error = None
+            try:
+                producer(stream)
+            except Exception as e:
+                error = e
+            finally:
+                with self._lock:
+                    self._in_flight.pop(key, None)
+                stream.finish(error)
+
+        # Generation runs on its own thread so it completes even if the first reader goes away
+        threading.Thread(target=run, name="coalesced-generation", daemon=True).start()
+        return stream
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._in_flight), "started": self.started, "coalesced": self.coalesced}
+
+
+class MicroBatcher:
+    """Collects concurrent single-item calls into one batch call.
+
+    A batch is dispatched when it reaches ``max_batch`` items or ``max_wait``
+    seconds after its first item arrived.
+    """
+
+    def __init__(self, batch_fn, max_batch=32, max_wait=0.005):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = self.batch_fn([item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches": self.batches,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
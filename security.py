@@ -1,15 +1,91 @@
+import io
 import os
+import struct
+import tempfile
+import time
 from cryptography.fernet import Fernet
 import bcrypt
 import base64
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from tracing import tracer
+
+# Framed file format: MAGIC | frame size (u32) | nonce prefix (8 bytes) | frames...
+# Every frame is AES-GCM over exactly FRAME_SIZE plaintext bytes except the last,
+# so frame i starts at HEADER_SIZE + i * (frame size + TAG_SIZE). The frame index
+# and a final-frame flag are bound into each frame's associated data, which
+# detects reordering and truncation.
+MAGIC = b"LRGENC1\n"
+HEADER = struct.Struct(">8sI8s")
+HEADER_SIZE = HEADER.size
+TAG_SIZE = 16
+FRAME_SIZE = 1024 * 1024
+
+class DecryptedReader(io.RawIOBase):
+    """Seekable read-only view of a framed file's plaintext, holding at most one decrypted frame."""
+
+    def __init__(self, security_manager, file_path):
+        self._manager = security_manager
+        self._file = open(file_path, 'rb')
+        self._header, self._frame_size, self._prefix, self._frame_count = security_manager._read_header(self._file)
+        sealed = os.fstat(self._file.fileno()).st_size - HEADER_SIZE
+        self._size = max(0, sealed - self._frame_count * TAG_SIZE)
+        self._position = 0
+        self._cached_index = None
+        self._cached = b""
+        self.decrypt_seconds = 0.0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._position = offset
+        return offset
+
+    def _frame(self, index):
+        if index != self._cached_index:
+            start = time.perf_counter()
+            self._cached = self._manager._decrypt_frame(
+                self._file, self._header, self._frame_size, self._prefix, self._frame_count, index)
+            self._cached_index = index
+            self.decrypt_seconds += time.perf_counter() - start
+        return self._cached
+
+    def readinto(self, buffer):
+        if self._position >= self._size:
+            return 0
+        index, start = divmod(self._position, self._frame_size)
+        data = self._frame(index)[start:start + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        self._cached = b""
+        super().close()
+
 
 class SecurityManager:
     def __init__(self, key_file='secret.key'):
         self.key_file = key_file
         self.key = self._load_or_generate_key()
         self.cipher_suite = Fernet(self.key)
+        self.aead = AESGCM(self._derive_stream_key())
 
     def _load_or_generate_key(self):
         if os.path.exists(self.key_file):
@@ -21,20 +97,131 @@ class SecurityManager:
                 key_file.write(key)
             return key
 
+    def _derive_stream_key(self):
+        return HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b"legal-rag framed file encryption v1",
+        ).derive(base64.urlsafe_b64decode(self.key))
+
+    def _frame_aad(self, header, index, final):
+        return header + struct.pack(">Q?", index, final)
+
+    def _frame_nonce(self, prefix, index):
+        return prefix + struct.pack(">I", index)
+
+    def encrypt_stream(self, chunks, frame_size=FRAME_SIZE):
+        """Yields the framed encryption of an iterable of plaintext byte chunks."""
+        prefix = os.urandom(8)
+        header = HEADER.pack(MAGIC, frame_size, prefix)
+        yield header
+        index = 0
+        pending = bytearray()
+        for chunk in chunks:
+            pending += chunk
+            # Keep at least one byte back so the final frame is known before it is sealed
+            while len(pending) > frame_size:
+                frame = bytes(pending[:frame_size])
+                del pending[:frame_size]
+                yield self.aead.encrypt(self._frame_nonce(prefix, index), frame, self._frame_aad(header, index, False))
+                index += 1
+        yield self.aead.encrypt(self._frame_nonce(prefix, index), bytes(pending), self._frame_aad(header, index, True))
+
+    def encrypt_to_file(self, chunks, dest_path):
+        """Encrypts an iterable of plaintext chunks into dest_path via a temp file."""
+        directory = os.path.dirname(os.path.abspath(dest_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with tracer.span("crypto.encrypt"):
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    for block in self.encrypt_stream(chunks):
+                        out.write(block)
+                os.replace(tmp_path, dest_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        return True
+
     def encrypt_file(self, file_path):
         """Encrypts a file in place."""
-        with open(file_path, 'rb') as f:
-            data = f.read()
-        encrypted_data = self.cipher_suite.encrypt(data)
-        with open(file_path, 'wb') as f:
-            f.write(encrypted_data)
+        with tracer.span("crypto.encrypt"), open(file_path, 'rb') as f:
+            directory = os.path.dirname(os.path.abspath(file_path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    for block in self.encrypt_stream(iter(lambda: f.read(FRAME_SIZE), b"")):
+                        out.write(block)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        os.replace(tmp_path, file_path)
         return True
 
+    def is_framed(self, file_path):
+        with open(file_path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+
+    def _read_header(self, f):
+        header = f.read(HEADER_SIZE)
+        magic, frame_size, prefix = HEADER.unpack(header)
+        size = os.fstat(f.fileno()).st_size
+        stride = frame_size + TAG_SIZE
+        frame_count = max(1, -(-(size - HEADER_SIZE) // stride))
+        return header, frame_size, prefix, frame_count
+
+    def _decrypt_frame(self, f, header, frame_size, prefix, frame_count, index):
+        f.seek(HEADER_SIZE + index * (frame_size + TAG_SIZE))
+        sealed = f.read(frame_size + TAG_SIZE)
+        final = index == frame_count - 1
+        return self.aead.decrypt(self._frame_nonce(prefix, index), sealed, self._frame_aad(header, index, final))
+
+    def decrypt_stream(self, file_path):
+        """Yields decrypted plaintext frame by frame. Legacy Fernet files are decrypted whole."""
+        if not self.is_framed(file_path):
+            yield self._decrypt_legacy(file_path)
+            return
+        with open(file_path, 'rb') as f:
+            header, frame_size, prefix, frame_count = self._read_header(f)
+            for index in range(frame_count):
+                yield self._decrypt_frame(f, header, frame_size, prefix, frame_count, index)
+
+    def decrypt_frame(self, file_path, index):
+        """Decrypts a single frame of a framed file without touching the others."""
+        with open(file_path, 'rb') as f:
+            header, frame_size, prefix, frame_count = self._read_header(f)
+            if not 0 <= index < frame_count:
+                raise IndexError(f"Frame {index} out of range (0-{frame_count - 1})")
+            return self._decrypt_frame(f, header, frame_size, prefix, frame_count, index)
+
+    def read_range(self, file_path, offset, length):
+        """Returns plaintext bytes [offset, offset + length), decrypting only the frames involved."""
+        if not self.is_framed(file_path):
+            return self._decrypt_legacy(file_path)[offset:offset + length]
+        parts = []
+        with open(file_path, 'rb') as f:
+            header, frame_size, prefix, frame_count = self._read_header(f)
+            first = offset // frame_size
+            last = min(frame_count - 1, (offset + length - 1) // frame_size)
+            for index in range(first, last + 1):
+                parts.append(self._decrypt_frame(f, header, frame_size, prefix, frame_count, index))
+        start = offset - first * frame_size
+        return b"".join(parts)[start:start + length]
+
+    def open_decrypted(self, file_path):
+        """Opens a file's plaintext as a seekable binary stream, decrypting frames on demand."""
+        if not self.is_framed(file_path):
+            return io.BytesIO(self._decrypt_legacy(file_path))
+        return io.BufferedReader(DecryptedReader(self, file_path), buffer_size=64 * 1024)
+
+    def _decrypt_legacy(self, file_path):
+        with open(file_path, 'rb') as f:
+            return self.cipher_suite.decrypt(f.read())
+
     def decrypt_file(self, file_path):
         """Returns decrypted content of a file."""
-        with open(file_path, 'rb') as f:
-            encrypted_data = f.read()
-        return self.cipher_suite.decrypt(encrypted_data)
+        with tracer.span("crypto.decrypt"):
+            return b"".join(self.decrypt_stream(file_path))
 
     def hash_password(self, password):
         return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
@@ -42,6 +229,12 @@ class SecurityManager:
     def verify_password(self, stored_hash, password):
         return bcrypt.checkpw(password.encode('utf-8'), stored_hash)
 
+    def get_data_hash(self, data):
+        """SHA-256 of in-memory bytes, matching get_file_hash for the same content."""
+        sha256_hash = hashes.Hash(hashes.SHA256())
+        sha256_hash.update(data)
+        return sha256_hash.finalize().hex()
+
     def get_file_hash(self, file_path):
         """Generate SHA-256 hash of a file for integrity checking."""
         sha256_hash = hashes.Hash(hashes.SHA256())
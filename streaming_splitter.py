@@ -0,0 +1,85 @@
+import bisect
+import io
+
+try:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+except ImportError:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+
+
+def open_pdf(source):
+    """Returns a lazy PdfReader over PDF bytes, a path or a seekable binary stream."""
+    from pypdf import PdfReader
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    return PdfReader(source)
+
+
+def iter_pdf_pages(reader):
+    """Yields (page_number, text) one page at a time, extracting text only when the page is reached."""
+    for number, page in enumerate(reader.pages, start=1):
+        yield number, page.extract_text() or ""
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class StreamingSplitter:
+    """Splits a stream of pages into overlapping chunks without holding the whole text.
+
+    Only a window of roughly two chunks plus the current page is buffered. Chunks
+    continue across page boundaries, keep the configured overlap, and record the
+    page they start on (``page``) and end on (``page_end``).
+    """
+
+    def __init__(self, chunk_size=1000, chunk_overlap=200):
+        self.chunk_size = chunk_size
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+        )
+
+    def split_pages(self, pages, metadata):
+        buffer = ""
+        # Parallel lists: buffer offset where each page's text begins, and that page's number
+        page_offsets = []
+        page_numbers = []
+        for number, text in pages:
+            if not text:
+                continue
+            page_offsets.append(len(buffer))
+            page_numbers.append(number)
+            buffer += text
+            if len(buffer) < 2 * self.chunk_size:
+                continue
+            chunks = self.splitter.create_documents([buffer])
+            # The last chunk may still grow with the next page, so it stays buffered
+            for chunk in chunks[:-1]:
+                yield self._with_pages(chunk, metadata, page_offsets, page_numbers)
+            cut = chunks[-1].metadata["start_index"]
+            buffer = buffer[cut:]
+            keep = max(0, bisect.bisect_right(page_offsets, cut) - 1)
+            page_offsets = [max(0, offset - cut) for offset in page_offsets[keep:]]
+            page_numbers = page_numbers[keep:]
+        if buffer.strip():
+            for chunk in self.splitter.create_documents([buffer]):
+                yield self._with_pages(chunk, metadata, page_offsets, page_numbers)
+
+    def _with_pages(self, chunk, metadata, page_offsets, page_numbers):
+        start = chunk.metadata["start_index"]
+        end = start + max(0, len(chunk.page_content) - 1)
+        first = page_numbers[max(0, bisect.bisect_right(page_offsets, start) - 1)]
+        last = page_numbers[max(0, bisect.bisect_right(page_offsets, end) - 1)]
+        return Document(page_content=chunk.page_content, metadata=dict(metadata, page=first, page_end=last))
@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds in seconds for the exported latency histograms
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class SpanContext:
+    def __init__(self, trace_id, span_id):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+
+class Tracer:
+    """Records timing spans in a ring buffer, optionally appending them to a JSONL file.
+
+    Spans nest per thread. Work handed to another thread can continue a trace by
+    passing ``parent=tracer.current()`` captured on the original thread.
+
+    The ring buffer feeds the dashboard tables. The Prometheus export uses running
+    per-stage totals instead, which only ever grow as Prometheus counters must.
+    """
+
+    def __init__(self, capacity=10000, persist_path=None):
+        self.spans = deque(maxlen=capacity)
+        self.persist_path = persist_path
+        # name -> [cumulative count per bucket bound, sum, count]
+        self._totals = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def current(self):
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name, parent=None, **attrs):
+        parent = parent or self.current()
+        context = SpanContext(parent.trace_id if parent else uuid.uuid4().hex, uuid.uuid4().hex[:16])
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(context)
+        start_wall = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield attrs
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            stack.pop()
+            record = {
+                "trace_id": context.trace_id,
+                "span_id": context.span_id,
+                "parent_id": parent.span_id if parent else None,
+                "name": name,
+                "start": start_wall,
+                "duration": time.perf_counter() - start,
+                "attrs": attrs,
+            }
+            if error:
+                record["error"] = error
+            self.record(record)
+
+    def record_span(self, name, duration, parent=None, **attrs):
+        """Records a span ending now for work that was timed in pieces, e.g. interleaved pipeline stages."""
+        parent = parent or self.current()
+        self.record({
+            "trace_id": parent.trace_id if parent else uuid.uuid4().hex,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent.span_id if parent else None,
+            "name": name,
+            "start": time.time() - duration,
+            "duration": duration,
+            "attrs": attrs,
+        })
+
+    def record(self, record):
+        with self._lock:
+            self.spans.append(record)
+            totals = self._totals.setdefault(record["name"], [[0] * len(BUCKETS), 0.0, 0])
+            for i, bound in enumerate(BUCKETS):
+                if record["duration"] <= bound:
+                    totals[0][i] += 1
+            totals[1] += record["duration"]
+            totals[2] += 1
+            if self.persist_path:
+                with open(self.persist_path, "a") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.spans)
+
+    def durations_by_name(self):
+        durations = {}
+        for record in self.snapshot():
+            durations.setdefault(record["name"], []).append(record["duration"])
+        return durations
+
+    def summary(self):
+        """Count and latency percentiles per span name."""
+        rows = []
+        for name, values in sorted(self.durations_by_name().items()):
+            ordered = sorted(values)
+
+            def pct(p):
+                return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+            rows.append({"stage": name, "count": len(ordered), "p50_s": pct(50), "p95_s": pct(95),
+                         "p99_s": pct(99), "max_s": ordered[-1]})
+        return rows
+
+    def histogram(self, name):
+        """Non-cumulative bucket counts for one span name, keyed by bucket label."""
+        counts = {f"≤{bound}s": 0 for bound in BUCKETS}
+        counts[f">{BUCKETS[-1]}s"] = 0
+        for value in self.durations_by_name().get(name, []):
+            for bound in BUCKETS:
+                if value <= bound:
+                    counts[f"≤{bound}s"] += 1
+                    break
+            else:
+                counts[f">{BUCKETS[-1]}s"] += 1
+        return counts
+
+    def slowest(self, limit=10):
+        """Slowest recent root spans, each with the total time spent per child stage."""
+        records = self.snapshot()
+        by_trace = {}
+        for record in records:
+            by_trace.setdefault(record["trace_id"], []).append(record)
+        roots = sorted((r for r in records if r["parent_id"] is None), key=lambda r: r["duration"], reverse=True)
+        result = []
+        for root in roots[:limit]:
+            stages = {}
+            for record in by_trace[root["trace_id"]]:
+                if record is not root:
+                    stages[record["name"]] = stages.get(record["name"], 0.0) + record["duration"]
+            result.append({"root": root, "stages": stages})
+        return result
+
+    def prometheus_text(self, metric="legal_rag_stage_duration_seconds"):
+        """Renders span latencies as a Prometheus histogram in the text exposition format."""
+        lines = [f"# HELP {metric} Duration of traced stages.", f"# TYPE {metric} histogram"]
+        with self._lock:
+            totals = {name: (list(buckets), total, count) for name, (buckets, total, count) in self._totals.items()}
+        for name, (buckets, total, count) in sorted(totals.items()):
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            for bound, bucket_count in zip(BUCKETS, buckets):
+                lines.append(f'{metric}_bucket{{stage="{label}",le="{bound}"}} {bucket_count}')
+            lines.append(f'{metric}_bucket{{stage="{label}",le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{stage="{label}"}} {total}')
+            lines.append(f'{metric}_count{{stage="{label}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def timed_iter(iterable, totals, key):
+    """Yields from iterable, adding the seconds spent producing each item to totals[key]."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            totals[key] = totals.get(key, 0.0) + time.perf_counter() - start
+        yield item
+
+
+tracer = Tracer(persist_path=os.environ.get("RAG_TRACE_LOG"))
+span = tracer.span
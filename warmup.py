@@ -0,0 +1,139 @@
+import importlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """Wall-clock time of each import and initialization step, recorded once per process."""
+
+    def __init__(self):
+        self.steps = []
+        self._lock = threading.Lock()
+
+    def record(self, step, seconds):
+        with self._lock:
+            if all(name != step for name, _ in self.steps):
+                self.steps.append((step, seconds))
+
+    @contextmanager
+    def timed(self, step):
+        start = time.perf_counter()
+        with tracer.span(f"startup.{step}"):
+            yield
+        self.record(step, time.perf_counter() - start)
+
+    def rows(self):
+        with self._lock:
+            return [{"step": name, "seconds": seconds} for name, seconds in self.steps]
+
+
+startup_report = StartupReport()
+
+
+class Warmup:
+    """Imports the RAG stack, builds the engine and ingest worker, then preloads the models on a
+    background thread, so the login page never waits for langchain, Chroma or Ollama."""
+
+    def __init__(self, session_factory, security_manager, report=startup_report, retry_interval=30.0):
+        self.session_factory = session_factory
+        self.security_manager = security_manager
+        self.report = report
+        self.retry_interval = retry_interval
+        self._ready = threading.Event()
+        self._engine = None
+        self._worker = None
+        self._error = None
+        self._failed_at = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._run, name="warmup", daemon=True).start()
+        return self
+
+    def _retry_if_failed(self):
+        """Starts the warm-up again after a failure, at most once per ``retry_interval`` seconds,
+        so a transient error (e.g. Ollama not up yet) does not need a process restart."""
+        with self._lock:
+            if self._error is None or time.monotonic() - self._failed_at < self.retry_interval:
+                return
+            self._error = None
+            self._ready.clear()
+            self.start()
+
+    def _run(self):
+        try:
+            with self.report.timed("import rag_engine"):
+                rag_engine = importlib.import_module("rag_engine")
+            with self.report.timed("import ingest_queue"):
+                ingest_queue = importlib.import_module("ingest_queue")
+            with self.report.timed("engine init"):
+                engine = rag_engine.RAGEngine()
+            # A re-embed run that was interrupted mid-swap is finished or rolled back
+            # before any collection is opened, so no partition is missing or mixed
+            outcome = importlib.import_module("reembed").recover(engine.persist_directory)
+            if outcome:
+                logger.warning("Found an interrupted re-embed run: %s", outcome)
+            # Chunks still in the pre-partitioning shared collection are invisible to
+            # owner queries, so they are moved before the engine is handed out
+            try:
+                with self.report.timed("legacy partition migration"):
+                    migrated = importlib.import_module("migrate_partitions").migrate_legacy(engine)
+                if migrated:
+                    logger.warning("Moved %d chunks from the shared collection into %d owner partitions",
+                                   sum(migrated.values()), len(migrated))
+            except Exception:
+                logger.exception("Legacy partition migration failed; run migrate_partitions.py --drop-source")
+            with self.report.timed("ingest worker start"):
+                worker = ingest_queue.IngestWorker(self.session_factory, self.security_manager, engine).start()
+            self._engine, self._worker = engine, worker
+        except Exception as e:
+            logger.exception("RAG engine failed to start")
+            self._failed_at = time.monotonic()
+            self._error = e
+            return
+        finally:
+            self._ready.set()
+        # The engine is usable from here on; preloading only moves cost off the first query
+        try:
+            with self.report.timed("vector store open"):
+                engine.partition(None)
+            with self.report.timed("embedding model load"):
+                engine.warm_up_embeddings()
+            with self.report.timed("llm load"):
+                engine.warm_up_llm()
+        except Exception:
+            logger.exception("Model preload failed; models load on the first query instead")
+
+    def _wait(self, timeout=None):
+        self._retry_if_failed()
+        if not self._ready.wait(timeout):
+            raise TimeoutError("RAG engine is still starting")
+        if self._error is not None:
+            raise RuntimeError("RAG engine failed to start") from self._error
+
+    def engine(self, timeout=None):
+        """Blocks until the engine is built and returns it."""
+        self._wait(timeout)
+        return self._engine
+
+    def worker(self, timeout=None):
+        self._wait(timeout)
+        return self._worker
+
+    def ready(self):
+        return self._ready.is_set() and self._error is None
+
+    def warm_owner(self, owner):
+        """Opens an owner's partition in the background, e.g. right after they log in."""
+        def run():
+            try:
+                self.engine().partition(owner)
+            except Exception:
+                logger.exception("Could not open the partition of %s", owner)
+        threading.Thread(target=run, name="warmup-owner", daemon=True).start()